@@ -2,6 +2,7 @@ from pathlib import Path
 import multiprocess as mp
 
 import runcases
+import techniques
 
 
 # function to call execute method on a run case
@@ -17,6 +18,7 @@ if __name__ == "__main__":
     working_directory = Path().resolve()
     base_path = working_directory / "datasets"
     results_path = working_directory / "results"
+    cache_path = working_directory / "cache"
     # create results directory if it doesn't exist
     results_path.mkdir(parents=True, exist_ok=True)
     # dataset paths
@@ -25,6 +27,12 @@ if __name__ == "__main__":
     # result paths
     dynamic_tools_results = results_path / "dynamic_tools_deduplication"
     static_tools_results = results_path / "static_tools_deduplication"
+    # cache paths
+    embeddings_cache = cache_path / "embeddings"
+    models_cache = cache_path / "models"
+    wordnet_snapshot = cache_path / "wordnet"
+    # store for artifacts shared between workers, e.g. embeddings of the same corpus
+    shared_artifacts = techniques.SharedArtifactStore()
     run_cases = [
         # --- other experiments ---
         # *runcases.sbert_multiple_static_tools_descriptions(ds_path=str(static_tools_ds)),
@@ -32,6 +40,9 @@ if __name__ == "__main__":
         #     unique_ds_path=str(static_tools_ds),
         #     target_ds_path=str(static_tools_ds)
         # ),
+        # --- benchmarks (run with a single worker for comparable throughput) ---
+        # *runcases.sbert_inference_modes_benchmark(ds_path=str(static_tools_ds)),
+        # *runcases.gensim_lsi_training_benchmark(ds_path=str(static_tools_ds)),
         # --- dynamic tools findings deduplication ---
         # *runcases.dynamic_tools_deduplication(
         #     ds_path=str(dynamic_tools_ds),
@@ -41,6 +52,10 @@ if __name__ == "__main__":
         *runcases.static_tools_deduplication(
             ds_path=str(static_tools_ds),
             save_runcase_file_path=str(static_tools_results),
+            embeddings_cache_dir=str(embeddings_cache),
+            models_cache_dir=str(models_cache),
+            shared_artifacts=shared_artifacts,
+            wordnet_snapshot_dir=str(wordnet_snapshot),
         )
     ]
     # create a pool of process workers
@@ -50,3 +65,5 @@ if __name__ == "__main__":
     pool.close()
     # wait for all workers to complete
     pool.join()
+    # release shared memory published by workers
+    shared_artifacts.unlink_all()
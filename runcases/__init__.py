@@ -2,3 +2,4 @@ from .gensim_runcases import *
 from .sbert_runcases import *
 from .static_tools_runcases import *
 from .dynamic_tools_runcases import *
+from .benchmark_runcases import *
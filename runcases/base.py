@@ -1,7 +1,9 @@
 import json
+import time
+import inspect
 from pprint import pprint
 from datetime import datetime
-from typing import Union, Sequence
+from typing import Union, Sequence, Dict, Tuple
 from dataloaders.base import BaseDataLoader
 from techniques.base import BaseTechnique
 from corpus_formats.base import CorpusFormat
@@ -30,6 +32,9 @@ def print_runcase_report(runcases_data):
 
 
 class RunCase:
+    # technique parameters that only affect thresholding of similarities, not their computation
+    CLUSTERING_KWARGS = ("threshold", "transitive_clustering")
+
     def __init__(
         self,
         title: str,
@@ -57,6 +62,89 @@ class RunCase:
         self.technique_kwargs = technique_kwargs
         self.save_runcase_file_path = save_runcase_file_path
 
+    def _split_technique_kwargs(self, technique_kwargs: dict) -> Tuple[str, dict, dict]:
+        apply_parameters = inspect.signature(self.technique.apply).parameters
+        # fill in clustering parameters that were left to their defaults
+        clustering_kwargs = {
+            kwarg: technique_kwargs.get(kwarg, apply_parameters[kwarg].default)
+            for kwarg in self.CLUSTERING_KWARGS
+            if kwarg in apply_parameters
+        }
+        scoring_kwargs = {
+            kwarg: value
+            for kwarg, value in technique_kwargs.items()
+            if kwarg not in self.CLUSTERING_KWARGS
+        }
+        return repr(sorted(scoring_kwargs.items())), scoring_kwargs, clustering_kwargs
+
+    def _apply_technique(
+        self, technique_kwargs: dict, saved_scores: Dict[str, object]
+    ) -> Tuple[Dict[int, Sequence[int]], float, float]:
+        # returns results with their scoring and clustering times. techniques applied directly cannot separate
+        # both, so all of their time is scoring time. reused scores take no scoring time.
+        scoring_key, scoring_kwargs, clustering_kwargs = self._split_technique_kwargs(
+            technique_kwargs
+        )
+        start_time = time.perf_counter()
+        # techniques without thresholds or separate scoring are applied directly
+        if "threshold" not in clustering_kwargs or not self.technique.supports_scoring:
+            results = self.technique.apply(self.corpus, **technique_kwargs)
+            return results, time.perf_counter() - start_time, 0.0
+        if scoring_key not in saved_scores:
+            # score once with the lowest threshold of all entries sharing scoring parameters
+            min_threshold = min(
+                self._split_technique_kwargs(kwargs)[2]["threshold"]
+                for kwargs in self.technique_kwargs
+                if self._split_technique_kwargs(kwargs)[0] == scoring_key
+            )
+            saved_scores[scoring_key] = self.technique.score(
+                self.corpus, min_threshold=min_threshold, **scoring_kwargs
+            )
+        scoring_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        results = self.technique.cluster(saved_scores[scoring_key], **clustering_kwargs)
+        return results, scoring_time, time.perf_counter() - start_time
+
+    def sweep(
+        self,
+        thresholds: Sequence[float],
+        print_evaluation_fields: Sequence[str] = ("f-measure", "precision", "recall"),
+        **scoring_kwargs,
+    ) -> Sequence[dict]:
+        # evaluate transitive clusters of any number of thresholds from a single scoring pass
+        assert (
+            self.technique.supports_scoring
+        ), "Technique should support scoring separately from clustering."
+        start_time = time.perf_counter()
+        scores = self.technique.score(
+            self.corpus, min_threshold=min(thresholds), **scoring_kwargs
+        )
+        sweep_results = self.technique.evaluate_thresholds(
+            self.labels, scores, thresholds
+        )
+        runtime = time.perf_counter() - start_time
+        # print evaluation results
+        if print_evaluation_fields:
+            print(
+                f"==== \n"
+                f"RunCase sweep: `{self.title}`, "
+                f"Corpus: {self.corpus_format.name}, "
+                f"Params: `{scoring_kwargs}` "
+                f"\n===="
+            )
+            print("threshold", *print_evaluation_fields, sep="\t")
+            for sweep_result in sweep_results:
+                print(
+                    sweep_result["threshold"],
+                    *[
+                        sweep_result["evaluation"][field]
+                        for field in print_evaluation_fields
+                    ],
+                    sep="\t",
+                )
+            print(f"Runtime: {runtime:.2f}s for {len(thresholds)} thresholds")
+        return sweep_results
+
     def execute(
         self,
         print_report: bool = True,
@@ -75,6 +163,8 @@ class RunCase:
             "labels": {str(key): val for key, val in self.labels.items()},
             "runcases": [],
         }
+        # similarities computed by the technique, reused for every threshold
+        saved_scores = {}
         # apply technique on corpus and evaluate results
         for runcase_idx, technique_kwargs in enumerate(self.technique_kwargs):
             runcase_title = (
@@ -84,7 +174,11 @@ class RunCase:
                 f"Params: `{technique_kwargs}` "
                 f"\n===="
             )
-            results = self.technique.apply(self.corpus, **technique_kwargs)
+            results, scoring_time, clustering_time = self._apply_technique(
+                technique_kwargs, saved_scores
+            )
+            runtime = scoring_time + clustering_time
+            findings_per_second = len(self.corpus) / runtime if runtime > 0 else 0.0
             evaluation = self.technique.evaluate(self.labels, results)
             # print evaluation results
             if print_evaluation_fields:
@@ -110,9 +204,22 @@ class RunCase:
                     "\t",
                     evaluation["recall"],
                 )
+                print(
+                    f"Runtime: {runtime:.2f}s "
+                    f"(scoring {scoring_time:.2f}s, clustering {clustering_time:.2f}s, "
+                    f"{findings_per_second:.1f} findings/s)"
+                )
             # store runcases data
             runcases_data["runcases"].append(
-                {"title": runcase_title, "results": results, "evaluation": evaluation}
+                {
+                    "title": runcase_title,
+                    "results": results,
+                    "evaluation": evaluation,
+                    "runtime": runtime,
+                    "scoring_time": scoring_time,
+                    "clustering_time": clustering_time,
+                    "findings_per_second": findings_per_second,
+                }
             )
             # save runcase file for evaluation in SeFiLa if path provided
             # TODO: modify SeFiLa to save runcases
@@ -0,0 +1,69 @@
+import corpus_formats
+import dataloaders
+import techniques
+from typing import Sequence
+from .base import RunCase
+
+
+def sbert_inference_modes_benchmark(ds_path: str) -> Sequence[RunCase]:
+    # encoding time is reported as scoring time of the first threshold of each RunCase, later thresholds reuse
+    # the scores. RunCases should be executed one at a time for comparable numbers.
+    dataloader = dataloaders.SefilaDataLoaderV2(
+        path=ds_path,
+        remove_stopwords=False,
+        remove_linebreaks=True,
+        remove_special_characters=False,
+    )
+    corpus_format = corpus_formats.multiple_static_tools_ds_descriptions
+    for embedder in techniques.SbertSemanticSearch.EMBEDDERS:
+        for inference_mode in techniques.SbertSemanticSearch.INFERENCE_MODES:
+            yield RunCase(
+                title=f"SbertSemanticSearch {embedder}, inference {inference_mode}",
+                dataloader=dataloader,
+                corpus_format=corpus_format,
+                technique=techniques.SbertSemanticSearch(
+                    embedder=embedder, inference_mode=inference_mode
+                ),
+                technique_kwargs=[
+                    {"threshold": 0.7},
+                    {"threshold": 0.8},
+                    {"threshold": 0.9},
+                    {"threshold": 0.95},
+                ],
+            )
+
+
+def gensim_lsi_training_benchmark(ds_path: str) -> Sequence[RunCase]:
+    # training time is measured while building the RunCases and reported in their titles, next to the F-measure,
+    # scoring and clustering times reported by the RunCase itself
+    dataloader = dataloaders.SefilaDataLoaderV2(
+        path=ds_path,
+        remove_stopwords=False,
+        remove_linebreaks=True,
+        remove_special_characters=False,
+    )
+    corpus_format = corpus_formats.multiple_static_tools_ds_descriptions
+    initial_corpus, _ = dataloader.get_corpus(**corpus_format.format_dict)
+    for num_topics in [100, 200, 300, 350]:
+        for training_mode in techniques.GensimLsiSimilarity.TRAINING_MODES:
+            technique = techniques.GensimLsiSimilarity(
+                corpus=initial_corpus,
+                num_topics=num_topics,
+                training_mode=training_mode,
+            )
+            print(
+                f"GensimLsiSimilarity Topics {num_topics}, training {training_mode}: "
+                f"{technique.training_time:.2f}s"
+            )
+            yield RunCase(
+                title=f"GensimLsiSimilarity Topics {num_topics}, training {training_mode} "
+                f"({technique.training_time:.2f}s)",
+                dataloader=dataloader,
+                corpus_format=corpus_format,
+                technique=technique,
+                technique_kwargs=[
+                    {"threshold": 0.5},
+                    {"threshold": 0.7},
+                    {"threshold": 0.9},
+                ],
+            )
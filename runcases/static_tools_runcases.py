@@ -83,7 +83,12 @@ def corpus_aggregation_static_tools_descriptions(
 
 
 def static_tools_deduplication(
-    ds_path: str, save_runcase_file_path: str = None
+    ds_path: str,
+    save_runcase_file_path: str = None,
+    embeddings_cache_dir: str = None,
+    models_cache_dir: str = None,
+    shared_artifacts: techniques.SharedArtifactStore = None,
+    wordnet_snapshot_dir: str = None,
 ) -> Sequence[RunCase]:
     # corpus formats
     cve_ids_corpus_format = corpus_formats.multiple_static_tools_ds_cve_ids
@@ -117,9 +122,10 @@ def static_tools_deduplication(
     }
     # techniques
     sbert_semantic_search = techniques.SbertSemanticSearch(
-        embedder=techniques.SbertSemanticSearch.EMBEDDERS[0]
+        embedder=techniques.SbertSemanticSearch.EMBEDDERS[0],
+        cache_dir=embeddings_cache_dir,
+        shared_artifacts=shared_artifacts,
     )
-    kg_similarity = techniques.KnowledgeGraphBagOfWordsSimilarityV2()
     _techniques_kwargs = {
         "SbertSemanticSearch": [
             # {"threshold": 0.1},
@@ -166,10 +172,16 @@ def static_tools_deduplication(
             return sbert_semantic_search
         elif _technique_name == "GensimLsiSimilarity":
             return techniques.GensimLsiSimilarity(
-                corpus=_corpus[_dataloader_name], num_topics=350
+                corpus=_corpus[_dataloader_name],
+                num_topics=350,
+                cache_dir=models_cache_dir,
             )
         elif _technique_name == "KgSimilarity":
-            return kg_similarity
+            # created only when scheduled, since it may build the WordNet snapshot
+            return techniques.KnowledgeGraphBagOfWordsSimilarityV2(
+                shared_artifacts=shared_artifacts,
+                wordnet_snapshot=wordnet_snapshot_dir,
+            )
 
     for dataloader_name in [
         # "Descriptions",
@@ -1,5 +1,11 @@
-from .base import BaseTechnique
+from .base import BaseTechnique, SimilarityScores
+from .shared_artifacts import SharedArtifactStore
 from .gensim_lsi_similarity import GensimLsiSimilarity
 from .sbert_semantic_search import SbertSemanticSearch
 from .equality_comparison import EqualityComparison
-from .kg_similarity.bow_similarity import KnowledgeGraphBagOfWordsSimilarityV1, KnowledgeGraphBagOfWordsSimilarityV2
+from .kg_similarity.bow_similarity import (
+    KnowledgeGraphBagOfWordsSimilarityV1,
+    KnowledgeGraphBagOfWordsSimilarityV2,
+    KnowledgeGraphBagOfWordsSimilarityV3,
+)
+from .kg_similarity.wordnet_similarity import WordNetTaxonomy
@@ -0,0 +1,111 @@
+from typing import Tuple
+import numpy as np
+import numpy.typing as npt
+
+from techniques.similarity_search import normalize_embeddings
+
+
+class IvfFlatIndex:
+    def __init__(
+        self,
+        num_lists: int = None,
+        num_probes: int = 8,
+        num_iterations: int = 10,
+        block_size: int = 512,
+        seed: int = 0,
+    ) -> None:
+        # number of clusters (inverted lists) the corpus is partitioned into, sqrt(N) if not given
+        self.num_lists = num_lists
+        # number of closest lists scanned per query, trades speed for recall
+        self.num_probes = num_probes
+        self.num_iterations = num_iterations
+        self.block_size = block_size
+        self.seed = seed
+        self.embeddings = None
+        self.centroids = None
+        self.list_members = []
+
+    def _closest_centroids(self, embeddings: npt.NDArray, count: int) -> npt.NDArray:
+        count = min(count, len(self.centroids))
+        closest = []
+        for block_start in range(0, len(embeddings), self.block_size):
+            block_scores = (
+                embeddings[block_start : block_start + self.block_size]
+                @ self.centroids.T
+            )
+            if count < len(self.centroids):
+                block_closest = np.argpartition(-block_scores, count - 1, axis=1)
+                block_closest = block_closest[:, :count]
+            else:
+                block_closest = np.tile(
+                    np.arange(len(self.centroids)), (len(block_scores), 1)
+                )
+            closest.append(block_closest)
+        return np.concatenate(closest)
+
+    def fit(self, embeddings: npt.NDArray) -> "IvfFlatIndex":
+        self.embeddings = normalize_embeddings(embeddings)
+        num_entries = len(self.embeddings)
+        num_lists = self.num_lists or int(np.ceil(np.sqrt(num_entries)))
+        num_lists = max(1, min(num_lists, num_entries))
+        # spherical k-means over the normalized embeddings
+        rng = np.random.default_rng(self.seed)
+        self.centroids = self.embeddings[
+            rng.choice(num_entries, size=num_lists, replace=False)
+        ]
+        assignments = None
+        for _ in range(self.num_iterations):
+            assignments = self._closest_centroids(self.embeddings, 1)[:, 0]
+            centroids = np.zeros_like(self.centroids)
+            np.add.at(centroids, assignments, self.embeddings)
+            # re-seed empty lists with random corpus entries
+            empty_lists = np.bincount(assignments, minlength=num_lists) == 0
+            centroids[empty_lists] = self.embeddings[
+                rng.choice(num_entries, size=int(empty_lists.sum()))
+            ]
+            self.centroids = normalize_embeddings(centroids)
+        assignments = self._closest_centroids(self.embeddings, 1)[:, 0]
+        # build inverted lists of corpus positions per centroid
+        order = np.argsort(assignments, kind="stable")
+        split_positions = np.cumsum(np.bincount(assignments, minlength=num_lists))
+        self.list_members = np.split(order, split_positions[:-1])
+        return self
+
+    def threshold_search(
+        self, threshold: float, query_embeddings: npt.NDArray = None
+    ) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        assert self.embeddings is not None, "Index should be fitted before searching."
+        if query_embeddings is None:
+            query_embeddings = self.embeddings
+        else:
+            query_embeddings = normalize_embeddings(query_embeddings)
+        # group queries by the lists they probe, so that every list is scanned once
+        probes = self._closest_centroids(query_embeddings, self.num_probes)
+        probe_queries = np.repeat(np.arange(len(query_embeddings)), probes.shape[1])
+        probe_lists = probes.flatten()
+        order = np.argsort(probe_lists, kind="stable")
+        split_positions = np.cumsum(
+            np.bincount(probe_lists, minlength=len(self.centroids))
+        )
+        rows, cols, scores = [], [], []
+        for list_idx, queries in enumerate(
+            np.split(probe_queries[order], split_positions[:-1])
+        ):
+            members = self.list_members[list_idx]
+            if len(queries) == 0 or len(members) == 0:
+                continue
+            list_embeddings = self.embeddings[members]
+            for block_start in range(0, len(queries), self.block_size):
+                block_queries = queries[block_start : block_start + self.block_size]
+                block_scores = query_embeddings[block_queries] @ list_embeddings.T
+                block_rows, block_cols = np.nonzero(block_scores >= threshold)
+                rows.append(block_queries[block_rows])
+                cols.append(members[block_cols])
+                scores.append(block_scores[block_rows, block_cols])
+        if len(rows) == 0:
+            return (
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.float32),
+            )
+        return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
@@ -1,6 +1,97 @@
 from abc import ABC, abstractmethod
 from itertools import combinations
-from typing import Dict, Any, Sequence
+from typing import Dict, Any, List, Sequence, Set, Tuple
+import numpy as np
+import numpy.typing as npt
+
+from techniques.clustering import SingleLinkageDendrogram, get_clusters
+from techniques.similarity_search import neighbour_lists
+
+
+class SimilarityScores:
+    def __init__(
+        self,
+        finding_ids: Sequence[int],
+        rows: npt.NDArray,
+        cols: npt.NDArray,
+        scores: npt.NDArray,
+        min_threshold: float,
+        text_positions: npt.NDArray = None,
+    ):
+        # sparse similarity graph of the distinct texts of a corpus: text at position `rows[i]` has similarity
+        # `scores[i]` with text at position `cols[i]`. only pairs with similarity >= `min_threshold` are kept.
+        self.finding_ids = np.asarray(finding_ids)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.cols = np.asarray(cols, dtype=np.int64)
+        self.scores = np.asarray(scores)
+        self.min_threshold = min_threshold
+        # position of the text of every finding, findings with equal texts are always related
+        if text_positions is None:
+            text_positions = np.arange(len(self.finding_ids))
+        self.text_positions = np.asarray(text_positions, dtype=np.int64)
+        self.num_texts = (
+            int(self.text_positions.max()) + 1 if len(self.text_positions) > 0 else 0
+        )
+        # optional scores of a reference method, e.g. exact search for approximate techniques
+        self.reference = None
+        self.dendrogram = None
+
+    def __len__(self) -> int:
+        return len(self.finding_ids)
+
+    def get_dendrogram(self) -> SingleLinkageDendrogram:
+        # built on first use, since it is only needed for transitive clusters of many thresholds
+        if self.dendrogram is None:
+            self.dendrogram = SingleLinkageDendrogram(
+                self.num_texts, self.rows, self.cols, self.scores
+            )
+        return self.dendrogram
+
+    def get_labels_for_thresholds(
+        self, thresholds: Sequence[float]
+    ) -> List[npt.NDArray]:
+        # findings are labelled with the transitive cluster of their text
+        return [
+            text_labels[self.text_positions]
+            for text_labels in self.get_dendrogram().get_labels_for_thresholds(
+                thresholds
+            )
+        ]
+
+    def get_neighbours(self, threshold: float) -> Dict[int, Sequence[int]]:
+        assert (
+            threshold >= self.min_threshold
+        ), "Threshold should not be lower than the one similarities were computed for."
+        passed = self.scores >= threshold
+        # every text is similar to itself
+        diagonal = np.arange(self.num_texts)
+        rows = np.concatenate([self.rows[passed], diagonal])
+        cols = np.concatenate([self.cols[passed], diagonal])
+        # expand every related text to the positions of the findings having it
+        text_counts = np.bincount(self.text_positions, minlength=self.num_texts)
+        text_offsets = np.cumsum(text_counts) - text_counts
+        text_findings = np.argsort(self.text_positions, kind="stable")
+        expanded_counts = text_counts[cols]
+        expanded_offsets = np.cumsum(expanded_counts) - expanded_counts
+        expanded_cols = text_findings[
+            np.repeat(text_offsets[cols] - expanded_offsets, expanded_counts)
+            + np.arange(expanded_counts.sum())
+        ]
+        expanded_rows = np.repeat(rows, expanded_counts)
+        # sort result into text -> sequence of related findings that pass our threshold, shared by all findings
+        # with that text
+        text_results = [
+            np.unique(self.finding_ids[neighbours]).tolist()
+            for neighbours in neighbour_lists(
+                expanded_rows, expanded_cols, self.num_texts
+            )
+        ]
+        return {
+            finding_id: text_results[text_position]
+            for finding_id, text_position in zip(
+                self.finding_ids.tolist(), self.text_positions.tolist()
+            )
+        }
 
 
 class BaseTechnique(ABC):
@@ -13,19 +104,107 @@ class BaseTechnique(ABC):
         pass
 
     @staticmethod
-    def _transitive_clustering(results):
-        for finding_id_1, finding_cluster in results.items():
-            # convert finding cluster to set
-            finding_cluster_final = set(finding_cluster)
-            for finding_id_2 in finding_cluster:
-                # skip if same finding
-                if finding_id_1 == finding_id_2:
-                    continue
-                # add all related findings to the formed cluster
-                finding_cluster_final.update(results[finding_id_2])
-            # add to original results
-            results[finding_id_1] = list(finding_cluster_final)
-        return results
+    def _get_unique_texts(
+        corpus: Dict[int, str],
+    ) -> Tuple[List[int], List[str], npt.NDArray]:
+        # collapse findings with equal texts, so that every distinct text is scored once
+        text_positions_mapping = {}
+        text_positions = [
+            text_positions_mapping.setdefault(
+                corpus_string, len(text_positions_mapping)
+            )
+            for corpus_string in corpus.values()
+        ]
+        return (
+            list(corpus.keys()),
+            list(text_positions_mapping.keys()),
+            np.array(text_positions, dtype=np.int64),
+        )
+
+    @property
+    def supports_scoring(self) -> bool:
+        # whether similarities can be scored once with `score` and reused for clusters of several thresholds
+        technique_class = type(self)
+        return (
+            technique_class._score_texts is not BaseTechnique._score_texts
+            or technique_class.score is not BaseTechnique.score
+        )
+
+    def _score_texts(
+        self, texts: Sequence[str], min_threshold: float, **kwargs
+    ) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        # techniques that can separate scoring from thresholding override this, so that similarities can be reused
+        # across thresholds. returns rows, columns and scores of distinct text pairs passing `min_threshold`.
+        raise NotImplementedError
+
+    def score(self, corpus, min_threshold: float = 0.0, **kwargs) -> SimilarityScores:
+        finding_ids, unique_texts, text_positions = self._get_unique_texts(corpus)
+        return SimilarityScores(
+            finding_ids,
+            *self._score_texts(unique_texts, min_threshold, **kwargs),
+            min_threshold=min_threshold,
+            text_positions=text_positions,
+        )
+
+    def cluster(
+        self,
+        scores: SimilarityScores,
+        threshold: float,
+        transitive_clustering: bool = True,
+    ) -> Dict[int, Sequence[int]]:
+        # normalize clusters based on transitive property if required
+        if transitive_clustering:
+            return get_clusters(
+                scores.finding_ids, scores.get_labels_for_thresholds([threshold])[0]
+            )
+        return scores.get_neighbours(threshold)
+
+    @staticmethod
+    def _count_pairs(
+        unique_predictions: Set[Tuple[int, ...]],
+        unique_labels: Set[Tuple[int, ...]],
+        num_finding_ids: int,
+    ) -> Tuple[int, int, int]:
+        # returns number of pairs in both P and Q (a), only in P (b) and only in Q (c)
+        is_partition = all(
+            sum(len(cluster) for cluster in clusters) == num_finding_ids
+            for clusters in (unique_predictions, unique_labels)
+        )
+        if not is_partition:
+            # overlapping clusters share pairs, so these need to be counted explicitly
+            pairs_p = set(
+                pair
+                for cluster in unique_predictions
+                for pair in combinations(cluster, 2)
+            )
+            pairs_q = set(
+                pair for cluster in unique_labels for pair in combinations(cluster, 2)
+            )
+            a = len(pairs_p.intersection(pairs_q))
+            return a, len(pairs_p) - a, len(pairs_q) - a
+
+        # for partitions, pairs can be counted from cluster sizes of a contingency table
+        def _get_cluster_indices(clusters):
+            finding_ids, cluster_indices = [], []
+            for cluster_idx, cluster in enumerate(clusters):
+                finding_ids.extend(cluster)
+                cluster_indices.extend([cluster_idx] * len(cluster))
+            order = np.argsort(finding_ids, kind="stable")
+            return np.array(cluster_indices, dtype=np.int64)[order]
+
+        def _count_cluster_pairs(counts):
+            counts = counts.astype(np.int64)
+            return int(np.sum(counts * (counts - 1) // 2))
+
+        prediction_indices = _get_cluster_indices(unique_predictions)
+        label_indices = _get_cluster_indices(unique_labels)
+        _, cell_counts = np.unique(
+            prediction_indices * len(unique_labels) + label_indices, return_counts=True
+        )
+        a = _count_cluster_pairs(cell_counts)
+        num_pairs_p = _count_cluster_pairs(np.bincount(prediction_indices))
+        num_pairs_q = _count_cluster_pairs(np.bincount(label_indices))
+        return a, num_pairs_p - a, num_pairs_q - a
 
     @staticmethod
     def evaluate(
@@ -33,9 +212,13 @@ class BaseTechnique(ABC):
         predictions: Dict[int, Sequence[int]],
         round_digits: int = 3,
     ) -> dict:
-        # establish unique predictions and labels
+        # establish unique predictions and labels (members of a transitive cluster share the same list, so these
+        # are sorted just once)
+        distinct_predictions = {id(pred): pred for pred in predictions.values()}
         unique_predictions = set(
-            tuple(sorted(pred)) for pred in predictions.values() if len(pred) > 0
+            tuple(sorted(pred))
+            for pred in distinct_predictions.values()
+            if len(pred) > 0
         )
         unique_labels = set(
             tuple(sorted(lbl)) for lbl in labels.values() if len(lbl) > 0
@@ -69,17 +252,11 @@ class BaseTechnique(ABC):
             D: unique_predictions_finding_ids
             P: unique_predictions
             Q: unique_labels  
+        Pairs are counted per cell of the P x Q contingency table when both are partitions of D.
         """
-        pairs_d = set(combinations(unique_predictions_finding_ids, 2))
-        pairs_p = set(
-            pair for cluster in unique_predictions for pair in combinations(cluster, 2)
+        a, b, c = BaseTechnique._count_pairs(
+            unique_predictions, unique_labels, len(unique_predictions_finding_ids)
         )
-        pairs_q = set(
-            pair for cluster in unique_labels for pair in combinations(cluster, 2)
-        )
-        a = len(pairs_p.intersection(pairs_q))
-        b = len(pairs_p - pairs_q)
-        c = len(pairs_q - pairs_p)
         precision = a / (a + c)
         recall = a / (a + b)
         f_measure = (2 * a) / ((2 * a) + b + c)
@@ -96,3 +273,25 @@ class BaseTechnique(ABC):
             "unmatched_predictions": list(unmatched_predictions),
             "matched_predictions": list(matched_predictions),
         }
+
+    def evaluate_thresholds(
+        self,
+        labels: Dict[Any, Sequence[int]],
+        scores: SimilarityScores,
+        thresholds: Sequence[float],
+        round_digits: int = 3,
+    ) -> List[dict]:
+        # transitive clusters of all thresholds are cuts of a single-linkage dendrogram, which is built once
+        results = []
+        for threshold, threshold_labels in zip(
+            thresholds, scores.get_labels_for_thresholds(thresholds)
+        ):
+            predictions = get_clusters(scores.finding_ids, threshold_labels)
+            results.append(
+                {
+                    "threshold": threshold,
+                    "predictions": predictions,
+                    "evaluation": self.evaluate(labels, predictions, round_digits),
+                }
+            )
+        return results
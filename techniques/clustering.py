@@ -0,0 +1,91 @@
+from typing import Dict, List, Sequence
+import numpy as np
+import numpy.typing as npt
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parents = list(range(size))
+        self.sizes = [1] * size
+
+    def find(self, element: int) -> int:
+        root = element
+        while self.parents[root] != root:
+            root = self.parents[root]
+        # compress path for faster future lookups
+        while self.parents[element] != root:
+            self.parents[element], element = root, self.parents[element]
+        return root
+
+    def union(self, element_1: int, element_2: int) -> bool:
+        root_1, root_2 = self.find(element_1), self.find(element_2)
+        if root_1 == root_2:
+            return False
+        # attach smaller tree to the larger one
+        if self.sizes[root_1] < self.sizes[root_2]:
+            root_1, root_2 = root_2, root_1
+        self.parents[root_2] = root_1
+        self.sizes[root_1] += self.sizes[root_2]
+        return True
+
+    def get_labels(self) -> npt.NDArray:
+        return np.array([self.find(element) for element in range(len(self.parents))])
+
+
+def get_clusters(
+    finding_ids: npt.NDArray, labels: npt.NDArray
+) -> Dict[int, Sequence[int]]:
+    # convert component labels to corpus id -> sequence of findings in the same component
+    order = np.argsort(labels, kind="stable")
+    split_positions = np.nonzero(np.diff(labels[order]))[0] + 1
+    results = {}
+    for component in np.split(order, split_positions):
+        cluster = sorted(finding_ids[component].tolist())
+        for finding_id in cluster:
+            results[finding_id] = cluster
+    return results
+
+
+class SingleLinkageDendrogram:
+    def __init__(
+        self,
+        num_entries: int,
+        rows: npt.NDArray,
+        cols: npt.NDArray,
+        scores: npt.NDArray,
+    ):
+        self.num_entries = num_entries
+        # sort candidate edges once by descending similarity and merge them in that order. only edges that join two
+        # components are recorded, together with the similarity (height) they were merged at.
+        order = np.argsort(-scores, kind="stable")
+        union_find = UnionFind(num_entries)
+        merges, heights = [], []
+        for row, col, score in zip(
+            rows[order].tolist(), cols[order].tolist(), scores[order].tolist()
+        ):
+            if union_find.union(row, col):
+                merges.append((row, col))
+                heights.append(score)
+        self.merges = np.array(merges, dtype=np.int64).reshape(-1, 2)
+        self.heights = np.array(heights, dtype=scores.dtype)
+
+    def get_labels(self, threshold: float) -> npt.NDArray:
+        # clusters at a threshold are the components joined by merges at or above it
+        return self.get_labels_for_thresholds([threshold])[0]
+
+    def get_labels_for_thresholds(
+        self, thresholds: Sequence[float]
+    ) -> List[npt.NDArray]:
+        # replay merges once, from the highest threshold to the lowest one
+        thresholds_order = np.argsort(thresholds)[::-1]
+        union_find = UnionFind(self.num_entries)
+        labels = [None] * len(thresholds)
+        merge_idx = 0
+        for threshold_idx in thresholds_order:
+            # merges are sorted by descending height
+            num_merges = np.count_nonzero(self.heights >= thresholds[threshold_idx])
+            for row, col in self.merges[merge_idx:num_merges].tolist():
+                union_find.union(row, col)
+            merge_idx = max(merge_idx, num_merges)
+            labels[threshold_idx] = union_find.get_labels()
+        return labels
@@ -0,0 +1,265 @@
+import os
+import re
+import fcntl
+import hashlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
+import numpy as np
+import numpy.typing as npt
+
+
+class EmbeddingCache:
+    EVICTION_POLICIES = ["lru", "fifo"]
+    # embeddings are stored at half precision, which keeps their cosine similarities within ~1e-3
+    DTYPE = np.float16
+
+    def __init__(
+        self,
+        cache_dir: str,
+        model_name: str,
+        max_entries: int = 500000,
+        eviction_policy: str = "lru",
+    ) -> None:
+        assert (
+            eviction_policy in self.EVICTION_POLICIES
+        ), f"Eviction policy should be one of {self.EVICTION_POLICIES}."
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.eviction_policy = eviction_policy
+        # every model gets its own store, since embeddings are not comparable across models. entries are appended
+        # to the store in segments, so that saves only write new entries.
+        model_slug = re.sub("[^A-Za-z0-9_.-]+", "_", model_name)
+        self.cache_dir = Path(cache_dir) / model_slug
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.__dict__.update(self._get_empty_state())
+
+    @staticmethod
+    def _get_empty_state() -> dict:
+        return {
+            # entries are loaded on first use
+            "is_loaded": False,
+            # hash -> row mapping, memory-mapped embeddings and eviction ranks of stored entries
+            "keys": [],
+            "key_rows": {},
+            "segments": [],
+            "segment_ends": np.zeros(0, dtype=np.int64),
+            "ranks": np.zeros(0, dtype=np.int64),
+            "clock": 0,
+            # entries added since the last save follow the stored ones
+            "num_stored": 0,
+            "new_embeddings": [],
+            "is_modified": False,
+        }
+
+    def __getstate__(self) -> dict:
+        # other processes load entries from disk themselves instead of receiving a copy of them
+        state = self.__dict__.copy()
+        state.update(self._get_empty_state())
+        return state
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        # whitespace differences do not change the tokens seen by the embedder
+        return " ".join(text.split())
+
+    @classmethod
+    def get_key(cls, text: str) -> str:
+        return hashlib.sha1(cls.normalize_text(text).encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def _lock(self, operation: int) -> Iterator[None]:
+        # processes read the store together, but save into it one at a time
+        with open(self.cache_dir / ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _get_segment_numbers(self) -> List[int]:
+        return sorted(
+            int(path.name[len("segment-") :].split(".")[0])
+            for path in self.cache_dir.glob("segment-*.keys.npy")
+        )
+
+    def _get_segment_path(self, number: int, content: str) -> Path:
+        return self.cache_dir / f"segment-{number:08d}.{content}.npy"
+
+    @staticmethod
+    def _save_array(path: Path, array: npt.NDArray) -> None:
+        # write to a temporary file first so that concurrent readers never see a partial array
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(temp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(temp_path, path)
+
+    def _read_stored_entries(
+        self,
+    ) -> Tuple[List[str], List[npt.NDArray], npt.NDArray]:
+        # keys are read into memory, embeddings are memory-mapped
+        keys, segments = [], []
+        for number in self._get_segment_numbers():
+            keys.extend(
+                np.load(self._get_segment_path(number, "keys")).astype(str).tolist()
+            )
+            segments.append(
+                np.load(self._get_segment_path(number, "embeddings"), mmap_mode="r")
+            )
+        # ranks of entries whose ranks were not saved yet default to the oldest rank
+        ranks = np.zeros(len(keys), dtype=np.int64)
+        ranks_path = self.cache_dir / "ranks.npy"
+        if ranks_path.exists():
+            saved_ranks = np.load(ranks_path)[: len(keys)]
+            ranks[: len(saved_ranks)] = saved_ranks
+        return keys, segments, ranks
+
+    def _load(self) -> None:
+        if self.is_loaded:
+            return
+        with self._lock(fcntl.LOCK_SH):
+            self.keys, self.segments, self.ranks = self._read_stored_entries()
+        self.key_rows = {key: row for row, key in enumerate(self.keys)}
+        self.segment_ends = np.cumsum(
+            [len(segment) for segment in self.segments], dtype=np.int64
+        )
+        self.num_stored = len(self.keys)
+        self.clock = int(self.ranks.max()) + 1 if len(self.ranks) > 0 else 0
+        self.is_loaded = True
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self.keys)
+
+    def _get_embedding(self, row: int) -> npt.NDArray:
+        if row >= self.num_stored:
+            return self.new_embeddings[row - self.num_stored].astype(np.float32)
+        segment_idx = int(np.searchsorted(self.segment_ends, row, side="right"))
+        segment = self.segments[segment_idx]
+        return segment[row - self.segment_ends[segment_idx] + len(segment)].astype(
+            np.float32
+        )
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, npt.NDArray]:
+        self._load()
+        results = {}
+        for key in keys:
+            row = self.key_rows.get(key)
+            if row is None:
+                continue
+            results[key] = self._get_embedding(row)
+            # refresh rank of entry on access for least-recently-used eviction, ranks are persisted with the
+            # next insert, hits alone do not rewrite the cache
+            if self.eviction_policy == "lru":
+                self.ranks[row] = self.clock
+        self.clock += 1
+        return results
+
+    def put_many(self, keys: Sequence[str], embeddings: npt.NDArray) -> None:
+        self._load()
+        embeddings = np.asarray(embeddings, dtype=self.DTYPE)
+        num_new_keys = 0
+        for key, embedding in zip(keys, embeddings):
+            if key in self.key_rows:
+                continue
+            self.key_rows[key] = len(self.keys)
+            self.keys.append(key)
+            self.new_embeddings.append(embedding)
+            num_new_keys += 1
+        if num_new_keys == 0:
+            return
+        self.ranks = np.concatenate(
+            [self.ranks, np.full(num_new_keys, self.clock, dtype=np.int64)]
+        )
+        self.clock += 1
+        self.is_modified = True
+
+    def _evict(
+        self, keys: List[str], ranks: npt.NDArray
+    ) -> Tuple[List[str], npt.NDArray]:
+        num_to_evict = len(keys) - self.max_entries
+        if num_to_evict <= 0:
+            return keys, ranks
+        # keep the entries with the highest ranks, preserving their original order, and compact them into a single
+        # segment that replaces all others
+        rows_to_keep = np.sort(np.argsort(ranks, kind="stable")[num_to_evict:])
+        segment_numbers = self._get_segment_numbers()
+        segments = [
+            np.load(self._get_segment_path(number, "embeddings"), mmap_mode="r")
+            for number in segment_numbers
+        ]
+        number = segment_numbers[-1] + 1
+        embeddings_path = self._get_segment_path(number, "embeddings")
+        temp_path = embeddings_path.with_name(
+            f"{embeddings_path.name}.{os.getpid()}.tmp"
+        )
+        embeddings = np.lib.format.open_memmap(
+            temp_path,
+            mode="w+",
+            dtype=self.DTYPE,
+            shape=(len(rows_to_keep), segments[0].shape[1]),
+        )
+        # copy kept embeddings segment by segment
+        position, segment_start = 0, 0
+        for segment in segments:
+            segment_rows = rows_to_keep[
+                (rows_to_keep >= segment_start)
+                & (rows_to_keep < segment_start + len(segment))
+            ]
+            embeddings[position : position + len(segment_rows)] = segment[
+                segment_rows - segment_start
+            ]
+            position += len(segment_rows)
+            segment_start += len(segment)
+        embeddings.flush()
+        del embeddings
+        os.replace(temp_path, embeddings_path)
+        keys = [keys[row] for row in rows_to_keep]
+        self._save_array(
+            self._get_segment_path(number, "keys"), np.array(keys, dtype="S40")
+        )
+        # memory maps of other processes stay valid after their files are removed
+        for old_number in segment_numbers:
+            self._get_segment_path(old_number, "keys").unlink()
+            self._get_segment_path(old_number, "embeddings").unlink()
+        return keys, ranks[rows_to_keep]
+
+    def save(self) -> None:
+        if not self.is_modified:
+            return
+        # processes sharing the cache save one at a time. each one merges its entries with the stored ones and only
+        # writes entries that are not stored yet.
+        with self._lock(fcntl.LOCK_EX):
+            stored_keys, _, stored_ranks = self._read_stored_entries()
+            stored_key_rows = {key: row for row, key in enumerate(stored_keys)}
+            new_keys, new_embeddings, new_ranks = [], [], []
+            for row, key in enumerate(self.keys):
+                stored_row = stored_key_rows.get(key)
+                if stored_row is not None:
+                    # keep the most recent rank of entries used by several processes
+                    stored_ranks[stored_row] = max(
+                        stored_ranks[stored_row], self.ranks[row]
+                    )
+                elif row >= self.num_stored:
+                    new_keys.append(key)
+                    new_embeddings.append(self.new_embeddings[row - self.num_stored])
+                    new_ranks.append(self.ranks[row])
+            if len(new_keys) > 0:
+                number = max(self._get_segment_numbers(), default=-1) + 1
+                # keys are written last, since they mark the segment as complete
+                self._save_array(
+                    self._get_segment_path(number, "embeddings"),
+                    np.stack(new_embeddings),
+                )
+                self._save_array(
+                    self._get_segment_path(number, "keys"),
+                    np.array(new_keys, dtype="S40"),
+                )
+                stored_keys.extend(new_keys)
+                stored_ranks = np.concatenate(
+                    [stored_ranks, np.array(new_ranks, dtype=np.int64)]
+                )
+            stored_keys, stored_ranks = self._evict(stored_keys, stored_ranks)
+            self._save_array(self.cache_dir / "ranks.npy", stored_ranks)
+        # entries are re-loaded on next use, including those saved by other processes
+        self.__dict__.update(self._get_empty_state())
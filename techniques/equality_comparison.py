@@ -8,14 +8,18 @@ class EqualityComparison(BaseTechnique):
         self.skip_blank = skip_blank
 
     def apply(self, corpus: Dict[int, str]) -> Dict[int, Sequence[int]]:
-        results = defaultdict(list)
-        for finding_id_main, finding_text_main in corpus.items():
+        # bucket findings by text, since equal texts hash to the same bucket
+        text_buckets = defaultdict(list)
+        for finding_id, finding_text in corpus.items():
+            text_buckets[finding_text].append(finding_id)
+        for bucket in text_buckets.values():
+            bucket.sort()
+        # every finding is related to all findings in its bucket
+        results = {}
+        for finding_id, finding_text in corpus.items():
             # skip comparison if option enabled and text is blank
-            if self.skip_blank and not finding_text_main:
-                results[finding_id_main].append(finding_id_main)
+            if self.skip_blank and not finding_text:
+                results[finding_id] = [finding_id]
                 continue
-            for finding_id_sub, finding_text_sub in corpus.items():
-                if finding_text_main == finding_text_sub:
-                    results[finding_id_main].append(finding_id_sub)
-            results[finding_id_main].sort()
-        return dict(results)
+            results[finding_id] = text_buckets[finding_text]
+        return results
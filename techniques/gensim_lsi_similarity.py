@@ -1,17 +1,106 @@
+import time
 import utils
-from copy import deepcopy
+import hashlib
 from collections import defaultdict
-from typing import Dict, Sequence
-from gensim import corpora, models, similarities
+from typing import Dict, Sequence, Tuple
+import numpy as np
+import numpy.typing as npt
+from gensim import corpora, matutils, models, similarities
+from gensim.utils import SaveLoad
+from techniques import similarity_search
+from techniques.model_store import ModelStore
 from techniques.base import BaseTechnique
 
 
 class GensimLsiSimilarity(BaseTechnique):
+    MODEL_CLASSES = {
+        "dictionary": corpora.Dictionary,
+        "tf_idf": models.TfidfModel,
+        "lsi": models.LsiModel,
+        "index": similarities.MatrixSimilarity,
+    }
+    # parameters of `models.LsiModel` per training mode
+    TRAINING_MODES = {
+        # gensim defaults, a single pass over the corpus in chunks of 20000 documents
+        "default": {},
+        # multi-pass randomized decomposition, dominated by dense products that run on all cores of a multi-threaded
+        # BLAS
+        "randomized": {"onepass": False, "power_iters": 2, "extra_samples": 100},
+        # single pass over small chunks, which bounds the memory of every decomposition update
+        "streamed": {"chunksize": 2000, "power_iters": 1, "extra_samples": 50},
+    }
+
     def __init__(
-        self, corpus: Dict[int, str], tf_idf: bool = True, num_topics: int = 300
+        self,
+        corpus: Dict[int, str],
+        tf_idf: bool = True,
+        num_topics: int = 300,
+        block_size: int = 512,
+        cache_dir: str = None,
+        index_shard_size: int = None,
+        index_dir: str = None,
+        training_mode: str = "default",
+        lsi_params: dict = None,
     ):
+        assert (
+            training_mode in self.TRAINING_MODES
+        ), f"Training mode should be one of {list(self.TRAINING_MODES)}."
         self.param_corpus = corpus
+        # parameters of the LSI decomposition, e.g. `chunksize`, `power_iters`, `extra_samples`, `onepass` or
+        # `distributed`, override those of the training mode
+        self.lsi_params = {**self.TRAINING_MODES[training_mode], **(lsi_params or {})}
+        # number of queries scored at once against the index
+        self.block_size = block_size
+        # keep indexed documents in memory-mapped shards of `index_shard_size` rows in `index_dir` instead of RAM
+        self.index_shard_size = index_shard_size
+        self.index_dir = index_dir
         self.training_corpus = list(corpus.values())
+        # reload models trained earlier on the same corpus with the same parameters instead of retraining them
+        model_store = ModelStore(cache_dir) if cache_dir else None
+        fingerprint = hashlib.sha1(
+            "\0".join(
+                [
+                    f"tf_idf={tf_idf}",
+                    f"num_topics={num_topics}",
+                    f"index_shard_size={index_shard_size}",
+                    f"lsi_params={sorted(self.lsi_params.items())}",
+                    *self.training_corpus,
+                ]
+            ).encode("utf-8")
+        ).hexdigest()
+        model_classes = self.MODEL_CLASSES
+        if index_shard_size:
+            model_classes = {
+                **model_classes,
+                "index": similarity_search.ShardedIndex,
+            }
+        saved_models = (
+            model_store.load(fingerprint, model_classes) if model_store else None
+        )
+        # seconds spent on training, none if models were reloaded
+        self.training_time = None
+        if saved_models is None:
+            start_time = time.perf_counter()
+            saved_models = self._train_models(tf_idf, num_topics)
+            self.training_time = time.perf_counter() - start_time
+            if model_store:
+                model_store.save(fingerprint, saved_models)
+        self.dictionary = saved_models["dictionary"]
+        self.tf_idf = saved_models.get("tf_idf")
+        self.gensim_model = saved_models["lsi"]
+        self.corpus_index = saved_models["index"]
+        if index_shard_size:
+            # shards written after loading, e.g. by `add_documents`, go to the index directory
+            self.corpus_index.spill_dir = index_dir
+        # drift of documents added since training, see `add_documents`
+        self.trained_basis = None
+        self.update_statistics = {
+            "num_documents": 0,
+            "num_tokens": 0,
+            "num_unknown_tokens": 0,
+        }
+
+    def _train_models(self, tf_idf: bool, num_topics: int) -> Dict[str, SaveLoad]:
         # remove common words and tokenize
         texts = utils.remove_stopwords(self.training_corpus, tokenize=True)
         # remove words that appear only once
@@ -20,18 +109,177 @@ class GensimLsiSimilarity(BaseTechnique):
             for token in text:
                 frequency[token] += 1
         texts = [[token for token in text if frequency[token] > 1] for text in texts]
-        self.dictionary = corpora.Dictionary(texts)
-        corpus = [self.dictionary.doc2bow(text) for text in texts]
-        self.tf_idf = None
+        trained_models = {"dictionary": corpora.Dictionary(texts)}
+        corpus = [trained_models["dictionary"].doc2bow(text) for text in texts]
         if tf_idf:
             tfidf = models.TfidfModel(corpus)
             corpus = [tfidf[text] for text in corpus]
-            self.tf_idf = tfidf
-        self.gensim_model = models.LsiModel(
-            corpus, id2word=self.dictionary, num_topics=num_topics
+            trained_models["tf_idf"] = tfidf
+        trained_models["lsi"] = models.LsiModel(
+            corpus,
+            id2word=trained_models["dictionary"],
+            num_topics=num_topics,
+            **self.lsi_params,
         )
         # transform corpus to LSI space and index it
-        self.corpus_index = similarities.MatrixSimilarity(self.gensim_model[corpus])
+        if not self.index_shard_size:
+            trained_models["index"] = similarities.MatrixSimilarity(
+                trained_models["lsi"][corpus]
+            )
+            return trained_models
+        num_features = trained_models["lsi"].projection.u.shape[1]
+        trained_models["index"] = similarity_search.ShardedIndex(
+            num_features, shard_size=self.index_shard_size, spill_dir=self.index_dir
+        )
+        for shard_start in range(0, len(corpus), self.index_shard_size):
+            shard_corpus = corpus[shard_start : shard_start + self.index_shard_size]
+            trained_models["index"].append(
+                matutils.corpus2dense(
+                    trained_models["lsi"][shard_corpus],
+                    num_terms=num_features,
+                    num_docs=len(shard_corpus),
+                ).T
+            )
+        return trained_models
+
+    def add_documents(
+        self,
+        corpus: Dict[int, str],
+        max_unknown_token_share: float = 0.3,
+        max_subspace_drift: float = 0.1,
+    ) -> dict:
+        # index texts that are not indexed yet, without retraining on the whole corpus
+        indexed_texts = set(self.training_corpus)
+        new_texts = list(
+            dict.fromkeys(
+                text
+                for text in corpus.values()
+                if len(text) > 0 and text not in indexed_texts
+            )
+        )
+        if new_texts:
+            # vocabulary and tf-idf weights stay fixed until the next full training, words they do not know are
+            # counted as drift
+            vec_bows = []
+            for tokens in utils.remove_stopwords(new_texts, tokenize=True):
+                vec_bow, unknown_tokens = self.dictionary.doc2bow(
+                    tokens, return_missing=True
+                )
+                vec_bows.append(vec_bow)
+                self.update_statistics["num_tokens"] += len(tokens)
+                self.update_statistics["num_unknown_tokens"] += sum(
+                    unknown_tokens.values()
+                )
+            if self.tf_idf:
+                vec_bows = list(self.tf_idf[vec_bows])
+            # merge new documents into the decomposition
+            basis = np.array(self.gensim_model.projection.u)
+            if self.trained_basis is None:
+                self.trained_basis = basis
+            self.gensim_model.add_documents(vec_bows)
+            updated_basis = self.gensim_model.projection.u
+            # rotate indexed documents into the updated LSI space instead of projecting all of them again
+            rotation = basis.T @ updated_basis
+            new_vectors = matutils.corpus2dense(
+                self.gensim_model[vec_bows],
+                num_terms=updated_basis.shape[1],
+                num_docs=len(vec_bows),
+            ).T
+            if isinstance(self.corpus_index, similarity_search.ShardedIndex):
+                self.corpus_index.transform(rotation)
+                self.corpus_index.append(new_vectors)
+            else:
+                self.corpus_index.index = np.concatenate(
+                    [
+                        similarity_search.normalize_embeddings(
+                            self.corpus_index.index @ rotation
+                        ),
+                        similarity_search.normalize_embeddings(new_vectors),
+                    ]
+                )
+                self.corpus_index.num_features = updated_basis.shape[1]
+            self.training_corpus.extend(new_texts)
+            self.update_statistics["num_documents"] += len(new_texts)
+        # report drift accumulated since training
+        unknown_token_share = self.update_statistics["num_unknown_tokens"] / max(
+            self.update_statistics["num_tokens"], 1
+        )
+        subspace_drift = 0.0
+        if self.trained_basis is not None:
+            # cosines of principal angles between trained and current topic spaces
+            cosines = np.linalg.svd(
+                self.trained_basis.T @ self.gensim_model.projection.u,
+                compute_uv=False,
+            )
+            subspace_drift = float(1.0 - np.mean(np.clip(cosines, 0.0, 1.0)))
+        return {
+            "num_new_documents": len(new_texts),
+            "num_added_documents": self.update_statistics["num_documents"],
+            "unknown_token_share": unknown_token_share,
+            "subspace_drift": subspace_drift,
+            "retrain": unknown_token_share > max_unknown_token_share
+            or subspace_drift > max_subspace_drift,
+        }
+
+    def _score_texts(
+        self, texts: Sequence[str], min_threshold: float = 0.0
+    ) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        # map positions of indexed training documents to positions of the distinct texts, so that every text is
+        # matched by a single document
+        text_positions_mapping = {text: position for position, text in enumerate(texts)}
+        doc_positions = np.array(
+            [
+                text_positions_mapping.pop(doc_text, -1)
+                for doc_text in self.training_corpus
+            ],
+            dtype=np.int64,
+        )
+        # transform all non-empty queries to LSI space at once, no bag of words can be generated for empty ones.
+        # findings with empty texts are still related to each other.
+        query_positions = np.array(
+            [position for position, query in enumerate(texts) if len(query) > 0],
+            dtype=np.int64,
+        )
+        vec_bows = [
+            self.dictionary.doc2bow(texts[position].lower().split())
+            for position in query_positions
+        ]
+        if self.tf_idf:
+            vec_bows = self.tf_idf[vec_bows]
+        # query vectors are sized like the indexed ones, the LSI rank can be lower than `num_topics` on small
+        # vocabularies
+        query_vectors = matutils.corpus2dense(
+            self.gensim_model[vec_bows],
+            num_terms=self.corpus_index.num_features,
+            num_docs=len(query_positions),
+        ).T
+        if isinstance(self.corpus_index, similarity_search.ShardedIndex):
+            # stream over shards and keep documents that belong to the corpus
+            rows, cols, scores = similarity_search.sharded_threshold_search(
+                self.corpus_index,
+                query_vectors,
+                threshold=min_threshold,
+                block_size=self.block_size,
+            )
+            in_corpus = doc_positions[cols] >= 0
+            return (
+                query_positions[rows[in_corpus]],
+                doc_positions[cols[in_corpus]],
+                scores[in_corpus],
+            )
+        # compare against indexed documents that belong to the corpus, block by block
+        indexed_positions = np.nonzero(doc_positions >= 0)[0]
+        rows, cols, scores = similarity_search.threshold_search(
+            self.corpus_index.index[indexed_positions],
+            threshold=min_threshold,
+            block_size=self.block_size,
+            query_embeddings=query_vectors,
+        )
+        return (
+            query_positions[rows],
+            doc_positions[indexed_positions[cols]],
+            scores,
+        )
 
     def apply(
         self,
@@ -39,41 +287,5 @@ class GensimLsiSimilarity(BaseTechnique):
         threshold: float = 0.5,
         transitive_clustering: bool = True,
     ) -> Dict[int, Sequence[int]]:
-        # create string -> Id mapping
-        string_id_mapping = defaultdict(list)
-        for _id, corpus_string in corpus.items():
-            string_id_mapping[corpus_string].append(_id)
-        # sort result into corpus id -> sequence of related findings that pass our threshold
-        results = defaultdict(list)
-        empty_query_ids = []
-        for query_id, query in corpus.items():
-            # manually handle empty queries, since no bag of words can be generated for them
-            if len(query) == 0:
-                empty_query_ids.append(query_id)
-                continue
-            vec_bow = self.dictionary.doc2bow(query.lower().split())
-            if self.tf_idf:
-                vec_bow = self.tf_idf[vec_bow]
-            vec_model = self.gensim_model[vec_bow]
-            sims = self.corpus_index[vec_model]
-            sims = sorted(enumerate(sims), key=lambda item: -item[1])
-            string_id_mapping_copy = deepcopy(string_id_mapping)
-            results[query_id] = []
-            for doc_position, doc_score in sims:
-                if float(doc_score) < threshold:
-                    continue
-                doc_text = self.training_corpus[doc_position]
-                doc_id = string_id_mapping_copy[doc_text].pop()
-                if doc_id not in results[query_id]:
-                    results[query_id].append(doc_id)
-            results[query_id].sort()
-
-        # add results for empty queries in final results
-        empty_query_ids = sorted(empty_query_ids)
-        for query_id in empty_query_ids:
-            results[query_id] = empty_query_ids
-
-        # normalize clusters based on transitive property if required
-        if transitive_clustering:
-            results = self._transitive_clustering(results)
-        return dict(results)
+        scores = self.score(corpus, min_threshold=threshold)
+        return self.cluster(scores, threshold, transitive_clustering)
@@ -1,23 +1,55 @@
 import re
 import json
-from typing import Dict, Sequence, Tuple
+import math
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
 from pathlib import Path
-from collections import defaultdict
 import numpy as np
 import numpy.typing as npt
-from nltk.corpus import wordnet as wn
+from scipy import sparse
 from scipy.interpolate import interp1d
 
 import utils
 from techniques import BaseTechnique
+from techniques.shared_artifacts import SharedArtifactStore
+from techniques.kg_similarity.score_store import TriangularScoreStore
+from techniques.kg_similarity.wordnet_similarity import (
+    WordNetTaxonomy,
+    WordSimilarityTable,
+)
 
 
 class KnowledgeGraphBagOfWordsSimilarityV1(BaseTechnique):
-    def __init__(self):
+    def __init__(
+        self,
+        shared_artifacts: SharedArtifactStore = None,
+        scoring_processes: int = None,
+        wordnet_snapshot: str = None,
+        block_size: int = 512,
+    ):
         # initialize model
         self.ontology = "NLTK WordNet"
-        self.saved_word_similarities = {}
-        self.saved_sentence_similarities = {}
+        # number of texts scored at once against other texts
+        self.block_size = block_size
+        # resolve words with a snapshot of WordNet, see `WordNetTaxonomy.from_wordnet`, instead of loading WordNet.
+        # the snapshot is extracted from WordNet once if it does not exist yet.
+        self.wordnet_snapshot = wordnet_snapshot
+        if wordnet_snapshot and not Path(wordnet_snapshot).is_dir():
+            WordNetTaxonomy.from_wordnet().save(wordnet_snapshot)
+        self.wordnet_taxonomy = (
+            WordNetTaxonomy.load(wordnet_snapshot) if wordnet_snapshot else None
+        )
+        # number of processes scoring sentence pairs, pairs are scored in the calling process if not set
+        self.scoring_processes = scoring_processes
+        # share similarity matrices with other processes working on the same corpus
+        self.shared_artifacts = shared_artifacts
+        # precomputed similarities of the words of scored texts by word ID, see `_build_word_similarities`
+        self.word_similarity_table = None
+        self.word_ids = {}
+        self.is_skip_word = np.zeros(0, dtype=bool)
+        self.word_similarities = np.zeros((0, 0))
         # load skip words from given file
         self.skip_words = {}
         self.words_to_skip_file_name = (
@@ -30,6 +62,17 @@ class KnowledgeGraphBagOfWordsSimilarityV1(BaseTechnique):
         # transform skip words to dictionary
         self.skip_words = {word: True for word in self.skip_words}
 
+    def __getstate__(self) -> dict:
+        # memory-mapped snapshot is opened again instead of being copied to other processes
+        state = self.__dict__.copy()
+        state["wordnet_taxonomy"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        if self.wordnet_snapshot:
+            self.wordnet_taxonomy = WordNetTaxonomy.load(self.wordnet_snapshot)
+
     def _update_skip_words_file(self):
         # transform skip words back to dictionary
         self.skip_words_list = [
@@ -44,183 +87,255 @@ class KnowledgeGraphBagOfWordsSimilarityV1(BaseTechnique):
             json.dump(self.skip_words_file_content, f)
 
     @staticmethod
-    def _compute_words_similarity_score(word_1: str, word_2: str) -> float:
-        # maximum similarity if words are same
-        if word_1 == word_2:
-            return 1.0
-        # retrieve synsets of both words
-        synsets_word1 = wn.synsets(word_1)
-        synsets_word2 = wn.synsets(word_2)
-        # similarity score is zero if any of the synsets do not exist
-        if len(synsets_word1) == 0 or len(synsets_word2) == 0:
-            return 0.0
-
-        # retrieve synsets with lowest sense value
-        def filter_lowest_sense_synsets(original_synsets):
-            _all_senses = [
-                int(synset.name().split(".")[-1]) for synset in original_synsets
-            ]
-            _min_sense = f".{min(_all_senses):02d}"
-            return [
-                synset for synset in original_synsets if _min_sense in synset.name()
-            ]
-
-        synsets_filtered_word1 = filter_lowest_sense_synsets(synsets_word1)
-        synsets_filtered_word2 = filter_lowest_sense_synsets(synsets_word2)
-
-        assert (
-            len(synsets_filtered_word1) > 0 and len(synsets_filtered_word2) > 0
-        ), "There should be at least one synset for each word"
-
-        # function to get preferred synset
-        def _get_preferred_pos_synset(all_synsets):
-            # return the first synset if just one synset in list
-            if len(all_synsets) == 1:
-                return all_synsets[0]
-            # get preferred part-of-speech synset
-            pos_preferences = ["v", "n", "a"]
-            for _pos in pos_preferences:
-                for _synset in all_synsets:
-                    if f".{_pos}." in _synset.name():
-                        return _synset
-            # if we're here it means our preferred pos was not present and more synsets available
-            # hence return the first synset
-            return all_synsets[0]
-
-        # get final synsets of words
-        synset_word1 = _get_preferred_pos_synset(synsets_filtered_word1)
-        synset_word2 = _get_preferred_pos_synset(synsets_filtered_word2)
-        # compute wup similarity between both synsets
-        return synset_word1.wup_similarity(synset_word2)
+    def _get_sentence_words(sentence: str) -> List[str]:
+        # remove stopwords
+        sentence = utils.remove_stopwords(sentence)
+        # remove digits and special characters, since irrelevant for KG
+        sentence = re.sub("[^A-Za-z ]+", "", sentence)
+        # remove any extra whitespaces and convert to list of words
+        return " ".join(sentence.split()).split(" ")
 
-    @staticmethod
-    def _get_saved_similarity(
-        string_1: str, string_2: str, saved_collection: Dict[Tuple[str, str], float]
-    ) -> (bool, float):
-        combination = (string_1, string_2)
-        if combination in saved_collection:
-            return True, saved_collection[combination]
-        return False, None
+    def _build_word_similarities(self, text_words: Sequence[List[str]]) -> None:
+        # resolve the words of all texts against WordNet at once, instead of once per pair of words
+        vocabulary = dict.fromkeys(word for words in text_words for word in words)
+        if all(word in self.word_ids for word in vocabulary):
+            return
+        table_vocabulary = [
+            word for word in vocabulary if not self.skip_words.get(word, False)
+        ]
+        if self.word_similarity_table is None or not all(
+            word in self.word_similarity_table for word in table_vocabulary
+        ):
+            self.word_similarity_table = WordSimilarityTable(
+                table_vocabulary, self.wordnet_taxonomy
+            )
+        # word IDs of the table are followed by those of skip words
+        self.word_ids = dict(self.word_similarity_table.word_ids)
+        for word in vocabulary:
+            self.word_ids.setdefault(word, len(self.word_ids))
+        num_table_words = len(self.word_similarity_table.words)
+        self.is_skip_word = np.arange(len(self.word_ids)) >= num_table_words
+        # equal words are counted with maximum similarity, pairs with skip words are left out otherwise
+        self.word_similarities = np.zeros((len(self.word_ids), len(self.word_ids)))
+        self.word_similarities[:num_table_words, :num_table_words] = (
+            self.word_similarity_table.similarities
+        )
+        np.fill_diagonal(self.word_similarities, 1.0)
 
-    @staticmethod
-    def _save_string_similarity(
-        string_1: str,
-        string_2: str,
-        similarity: float,
-        saved_collection: Dict[Tuple[str, str], float],
-    ) -> None:
-        for combination in [(string_1, string_2), (string_2, string_1)]:
-            saved_collection[combination] = similarity
+    def _tokenize_texts(self, texts: Sequence[str]) -> List[npt.NDArray]:
+        # preprocess every text once into the IDs of its words, empty texts have no words
+        text_words = [
+            self._get_sentence_words(text) if len(text) > 0 else [] for text in texts
+        ]
+        self._build_word_similarities(text_words)
+        return [
+            np.array([self.word_ids[word] for word in words], dtype=np.int64)
+            for words in text_words
+        ]
 
     def _compute_sentence_similarity_score(
-        self, sentence_1: str, sentence_2: str
+        self, word_ids_1: npt.NDArray, word_ids_2: npt.NDArray
     ) -> float:
-        # return highest similarity if sentences are the same
-        if sentence_1 == sentence_2:
-            return 1.0
-        # similarity is least if one of the sentences is an empty string
-        if len(sentence_1) == 0 or len(sentence_2) == 0:
+        # equal words have maximum similarity, other pairs of words are compared unless one of them is skipped
+        is_compared = (word_ids_1[:, None] == word_ids_2[None, :]) | (
+            ~self.is_skip_word[word_ids_1][:, None]
+            & ~self.is_skip_word[word_ids_2][None, :]
+        )
+        word_similarity_count = np.count_nonzero(is_compared)
+        # similarity is least if no words are compared, e.g. if one of the sentences is an empty string
+        if word_similarity_count == 0:
             return 0.0
-        # remove stopwords
-        sentence_1, sentence_2 = utils.remove_stopwords((sentence_1, sentence_2))
-        # remove digits and special characters, since irrelevant for KG
-        sentence1, sentence2 = re.sub("[^A-Za-z ]+", "", sentence_1), re.sub(
-            "[^A-Za-z ]+", "", sentence_2
+        # normalize
+        total_similarity = self.word_similarities[np.ix_(word_ids_1, word_ids_2)].sum()
+        return float(total_similarity / word_similarity_count)
+
+    @staticmethod
+    def _get_pairs_to_score(
+        text_ids: npt.NDArray, is_empty: npt.NDArray, row_start: int, row_end: int
+    ) -> Tuple[npt.NDArray, npt.NDArray]:
+        # similarities are mirrored across the diagonal, so we need to compute just the upper triangle
+        rows, cols = np.nonzero(
+            np.triu(
+                np.ones((row_end - row_start, len(text_ids)), dtype=bool),
+                k=row_start + 1,
+            )
         )
-        # remove any extra whitespaces
-        sentence1, sentence2 = " ".join(sentence1.split()), " ".join(sentence2.split())
-        # convert words to list of words
-        sentence1 = sentence1.split(" ")
-        sentence2 = sentence2.split(" ")
-        all_words = {*sentence1, *sentence2}
-        # check for words not present in ontology
-        for word in all_words:
-            if word not in self.skip_words:
-                self.skip_words[word] = (
-                    self._compute_words_similarity_score(word, word) == 0
-                )
-        # compute similarity
-        word_similarity_count = 0
-        total_similarity = 0.0
-        for word1 in sentence1:
-            for word2 in sentence2:
-                # assign max similarity if words are same
-                if word1 == word2:
-                    total_similarity += 1.0
-                    word_similarity_count += 1
-                    continue
-                # skip if words not present in ontology
-                if self.skip_words[word1] or self.skip_words[word2]:
-                    continue
-                # check if word similarity already computed
-                (
-                    saved_similarity_available,
-                    similarity_score,
-                ) = self._get_saved_similarity(
-                    string_1=word1,
-                    string_2=word2,
-                    saved_collection=self.saved_word_similarities,
+        rows += row_start
+        # similarities of equal texts and of empty texts are known
+        to_score = (
+            (text_ids[rows] != text_ids[cols]) & ~is_empty[rows] & ~is_empty[cols]
+        )
+        return rows[to_score], cols[to_score]
+
+    def _score_rows(
+        self,
+        text_word_ids: Sequence[npt.NDArray],
+        text_ids: npt.NDArray,
+        is_empty: npt.NDArray,
+        row_start: int,
+        row_end: int,
+    ) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        rows, cols = self._get_pairs_to_score(text_ids, is_empty, row_start, row_end)
+        return self._score_pairs(text_word_ids, rows, cols)
+
+    def _score_pairs(
+        self, text_word_ids: Sequence[npt.NDArray], rows: npt.NDArray, cols: npt.NDArray
+    ) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        scores = np.array(
+            [
+                self._compute_sentence_similarity_score(
+                    text_word_ids[row], text_word_ids[col]
                 )
-                if not saved_similarity_available:
-                    # compute word-net similarity and save for future use
-                    similarity_score = self._compute_words_similarity_score(
-                        word1, word2
-                    )
-                    self._save_string_similarity(
-                        string_1=word1,
-                        string_2=word2,
-                        similarity=similarity_score,
-                        saved_collection=self.saved_word_similarities,
-                    )
-                # aggregate
-                total_similarity += similarity_score
-                word_similarity_count += 1
-        # normalize
-        if word_similarity_count > 0:
-            total_similarity /= word_similarity_count
-            return total_similarity
-        else:
-            return 0.0
+                for row, col in zip(rows.tolist(), cols.tolist())
+            ],
+            dtype=float,
+        )
+        return rows, cols, scores
 
-    def _compute_text_matrix_similarity(self, matrix) -> npt.NDArray:
-        blank_sentences_indices = matrix[0] == ""
-        assert np.all(
-            blank_sentences_indices == (matrix[1] == "")
-        ), "Sentences for comparison should either both be blank or available."
-        results_matrix = np.full(matrix.shape[1:], -1, dtype=float)
-        # create arrays of indices, first sentences, and second sentences
-        non_empty_str_indices = np.argwhere(matrix[0] != "").flatten().tolist()
-        sentence_1_list = matrix[0][non_empty_str_indices].tolist()
-        sentence_2_list = matrix[1][non_empty_str_indices].tolist()
-
-        # compute similarity scores between sentence pairs
-        original_similarities = {}
-        for index, sentence_1, sentence_2 in zip(
-            non_empty_str_indices, sentence_1_list, sentence_2_list
-        ):
-            score = self._compute_sentence_similarity_score(sentence_1, sentence_2)
-            original_similarities[index] = score
+    def _map_scoring(
+        self,
+        score: Callable[..., Any],
+        score_args: tuple,
+        blocks_args: Iterable[tuple],
+    ) -> Iterator[Any]:
+        # calls `score(*score_args, *block_args)` for every block, in order
+        if not self.scoring_processes or self.scoring_processes < 2:
+            for block_args in blocks_args:
+                yield score(*score_args, *block_args)
+            return
+        if mp.current_process().daemon:
+            # daemonic processes, e.g. `mp.Pool` workers, are not allowed to have child processes
+            raise ValueError(
+                "Scoring with multiple processes is not possible in a daemonic process, "
+                "set scoring_processes to 1 or run the technique in a non-daemonic process."
+            )
+        # blocks are scored by processes that get the technique and `score_args` once, hence need no WordNet. its
+        # lazy loader breaks when triggered from several threads. a few blocks per process are submitted ahead of
+        # the results being consumed, so that blocks can be generated lazily.
+        with ProcessPoolExecutor(
+            max_workers=self.scoring_processes,
+            initializer=_init_scoring_worker,
+            initargs=(score, score_args),
+        ) as executor:
+            futures = deque()
+            for block_args in blocks_args:
+                futures.append(executor.submit(_score_in_worker, *block_args))
+                if len(futures) >= self.scoring_processes * 2:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
 
+    def _compute_corpus_similarities(self, corpus_texts: Sequence[str]) -> npt.NDArray:
+        text_word_ids = self._tokenize_texts(corpus_texts)
+        num_entries = len(corpus_texts)
+        # texts are compared by integer IDs, equal texts share an ID
+        text_ids_mapping = {}
+        text_ids = np.array(
+            [
+                text_ids_mapping.setdefault(text, len(text_ids_mapping))
+                for text in corpus_texts
+            ],
+            dtype=np.int64,
+        )
+        is_empty = np.array([len(text) == 0 for text in corpus_texts], dtype=bool)
+        # texts are scored against the following texts block by block of rows, processes get smaller blocks so
+        # that work is spread evenly
+        block_size = self.block_size
+        if self.scoring_processes and self.scoring_processes > 1:
+            block_size = min(
+                block_size, math.ceil(num_entries / (self.scoring_processes * 4))
+            )
+        block_size = max(block_size, 1)
+        row_blocks = [
+            (row_start, min(row_start + block_size, num_entries))
+            for row_start in range(0, num_entries, block_size)
+        ]
+        # positions where one of the strings is empty have 0.0 similarity
+        similarities = np.zeros((num_entries, num_entries), dtype=np.float32)
+        range_min, range_max = np.inf, -np.inf
+        for rows, cols, scores in self._map_scoring(
+            self._score_rows, (text_word_ids, text_ids, is_empty), row_blocks
+        ):
+            if len(scores) > 0:
+                # range is taken from stored scores, so that all of them can be mapped
+                scores = scores.astype(np.float32)
+                similarities[rows, cols] = scores
+                range_min = min(range_min, scores.min())
+                range_max = max(range_max, scores.max())
         # map computed scores between 0 and 1
-        similarity_values = original_similarities.values()
-        range_min, range_max = min(similarity_values), max(similarity_values)
-        mapper_func = interp1d([range_min, range_max], [0.0, 1.0])
-        for idx, similarity in original_similarities.items():
-            results_matrix[idx] = mapper_func(similarity)
-
-        # TODO: The dataloader for nltk.corpus.wn causes error w/ multithreading. Fix bug.
-        # def _multithread_similarity_calculation(idx: int, sentence_1: str, sentence_2: str) -> Tuple[int, float]:
-        #     score = self._compute_sentence_similarity_score(sentence_1, sentence_2)
-        #     return idx, score
-        # # get results asynchronously
-        # with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-        #     results = executor.map(
-        #         _multithread_similarity_calculation, non_empty_str_indices, sentence_1_list, sentence_2_list
-        #     )
-        # for index, score in results:
-        #     results_matrix[index] = score
-
-        return results_matrix
+        mapper_func = None
+        if range_min <= range_max:
+            mapper_func = interp1d([range_min, range_max], [0.0, 1.0])
+        for row_start, row_end in row_blocks:
+            rows, cols = self._get_pairs_to_score(
+                text_ids, is_empty, row_start, row_end
+            )
+            if mapper_func is not None and len(rows) > 0:
+                similarities[rows, cols] = mapper_func(similarities[rows, cols])
+            # reflect similarity values along the diagonal
+            similarities[cols, rows] = similarities[rows, cols]
+            # positions where strings are equal have a 1.0 similarity
+            block_similarities = similarities[row_start:row_end]
+            block_similarities[
+                text_ids[row_start:row_end, None] == text_ids[None, :]
+            ] = 1.0
+        return similarities
+
+    def _score_texts(
+        self, texts: Sequence[str], min_threshold: float = 0.0
+    ) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        rows, cols, scores = self._get_shared_pair_scores(
+            texts,
+            min_threshold,
+            lambda: self._compute_pair_scores(texts, min_threshold),
+        )
+        # update skip words file
+        self._update_skip_words_file()
+        return rows, cols, scores
+
+    def _compute_pair_scores(
+        self, texts: Sequence[str], min_threshold: float
+    ) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        # compute similarities, or reuse them if another process already did for this corpus
+        if self.shared_artifacts is None:
+            similarities = self._compute_corpus_similarities(texts)
+        else:
+            artifact_key = "kg-similarities:" + self.shared_artifacts.get_fingerprint(
+                self.ontology, *texts
+            )
+            similarities = self.shared_artifacts.get_or_publish(
+                artifact_key, lambda: self._compute_corpus_similarities(texts)
+            )
+        # keep pairs that pass our threshold
+        rows, cols = np.nonzero(similarities >= min_threshold)
+        return rows, cols, similarities[rows, cols]
+
+    def _get_shared_pair_scores(
+        self,
+        texts: Sequence[str],
+        min_threshold: float,
+        compute_pair_scores: Callable[[], Tuple[npt.NDArray, npt.NDArray, npt.NDArray]],
+    ) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        # reuse scored pairs if another process already scored this corpus with the same threshold. workers only
+        # hold views of the shared pairs, not private copies of them.
+        if self.shared_artifacts is None:
+            return compute_pair_scores()
+        artifact_key = (
+            f"kg-pair-scores:{type(self).__name__}:"
+            + self.shared_artifacts.get_fingerprint(
+                self.ontology, str(min_threshold), *texts
+            )
+        )
+        with self.shared_artifacts.lock(artifact_key):
+            pairs = self.shared_artifacts.get(artifact_key + ":pairs", timeout=0.0)
+            scores = self.shared_artifacts.get(artifact_key + ":scores", timeout=0.0)
+            if pairs is None or scores is None:
+                rows, cols, scores = compute_pair_scores()
+                pairs = self.shared_artifacts.publish(
+                    artifact_key + ":pairs", np.stack([rows, cols])
+                )
+                scores = self.shared_artifacts.publish(artifact_key + ":scores", scores)
+        return pairs[0], pairs[1], scores
 
     def apply(
         self,
@@ -228,123 +343,182 @@ class KnowledgeGraphBagOfWordsSimilarityV1(BaseTechnique):
         threshold: float = 0.25,
         transitive_clustering: bool = True,
     ) -> Dict[int, Sequence[int]]:
-        # convert finding Ids to array
-        finding_ids = np.array(list(corpus.keys()))
-        finding_texts = np.array(list(corpus.values()))
-        num_entries = len(corpus)
-        # create a matrix from list of finding Ids
-        finding_ids_matrix = np.tile(finding_ids, (num_entries, 1))
-        finding_texts_matrix = np.tile(finding_texts, (num_entries, 1))
-        # create combinations of finding texts to be compared together
-        finding_texts_combinations = np.array(
-            [finding_texts_matrix, np.transpose(finding_texts_matrix)]
-        )
-        # positions where one of the strings is empty has 0.0 similarity
-        positions_with_one_entry_empty = (
-            (finding_texts_combinations[0] == "")
-            & (finding_texts_combinations[1] != "")
-        ) | (
-            (finding_texts_combinations[1] == "")
-            & (finding_texts_combinations[0] != "")
-        )
-        # positions where strings are equal have a 1.0 similarity
-        positions_with_similar_strings = (
-            finding_texts_combinations[0] == finding_texts_combinations[1]
+        scores = self.score(corpus, min_threshold=threshold)
+        return self.cluster(scores, threshold, transitive_clustering)
+
+
+# scoring method of a technique and its arguments shared by all blocks, see `_init_scoring_worker`
+_worker_score = None
+_worker_score_args = None
+
+
+def _init_scoring_worker(score: Callable[..., Any], score_args: tuple) -> None:
+    global _worker_score, _worker_score_args
+    _worker_score = score
+    _worker_score_args = score_args
+
+
+def _score_in_worker(*block_args) -> Any:
+    return _worker_score(*_worker_score_args, *block_args)
+
+
+class KnowledgeGraphBagOfWordsSimilarityV2(KnowledgeGraphBagOfWordsSimilarityV1):
+    def __init__(
+        self,
+        shared_artifacts: SharedArtifactStore = None,
+        wordnet_snapshot: str = None,
+        score_spill_dir: str = None,
+        scoring_processes: int = None,
+        block_size: int = 512,
+    ):
+        super().__init__(
+            shared_artifacts,
+            scoring_processes=scoring_processes,
+            wordnet_snapshot=wordnet_snapshot,
+            block_size=block_size,
         )
-        # similarities are mirrored across the diagonal, so we need to compute just one set of similarities
-        indices_of_lower_triangle = np.tril_indices(num_entries)
-        positions_of_lower_triangle = np.zeros(
-            finding_texts_combinations.shape[1:], dtype=bool
+        # scores of sentence pairs computed so far, in a memory-mapped file in `score_spill_dir` if given
+        self.sentence_scores = TriangularScoreStore(spill_dir=score_spill_dir)
+
+    def _get_missing_pairs(
+        self, text_ids: npt.NDArray
+    ) -> Iterator[Tuple[npt.NDArray, npt.NDArray]]:
+        # pairs of the upper triangle without a stored score, block by block of rows
+        num_entries = len(text_ids)
+        for row_start in range(0, num_entries, self.block_size):
+            row_end = min(row_start + self.block_size, num_entries)
+            rows, cols = np.nonzero(
+                np.triu(
+                    np.ones((row_end - row_start, num_entries), dtype=bool),
+                    k=row_start + 1,
+                )
+            )
+            rows += row_start
+            is_missing = np.isnan(
+                self.sentence_scores.get(text_ids[rows], text_ids[cols])
+            )
+            if np.any(is_missing):
+                yield rows[is_missing], cols[is_missing]
+
+    # override
+    def _compute_pair_scores(
+        self, texts: Sequence[str], min_threshold: float
+    ) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        text_word_ids = self._tokenize_texts(texts)
+        text_ids = self.sentence_scores.get_text_ids(texts)
+        # compute similarities that were not computed before, every pair once
+        for missing_rows, missing_cols, missing_scores in self._map_scoring(
+            self._score_pairs, (text_word_ids,), self._get_missing_pairs(text_ids)
+        ):
+            self.sentence_scores.set(
+                text_ids[missing_rows], text_ids[missing_cols], missing_scores
+            )
+        rows, cols, scores = [], [], []
+        for position_main in range(len(texts)):
+            main_text_ids = np.full(len(texts), text_ids[position_main])
+            similarity_scores = self.sentence_scores.get(main_text_ids, text_ids)
+            # get all similar texts, including the text itself
+            similar_positions = np.nonzero(similarity_scores >= min_threshold)[0]
+            rows.append(np.full(len(similar_positions), position_main))
+            cols.append(similar_positions)
+            scores.append(similarity_scores[similar_positions])
+        if len(rows) == 0:
+            return (
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=float),
+            )
+        return (
+            np.concatenate(rows).astype(np.int64),
+            np.concatenate(cols).astype(np.int64),
+            np.concatenate(scores).astype(float),
         )
-        positions_of_lower_triangle[indices_of_lower_triangle] = True
-        positions_of_lower_triangle = np.array(
-            [positions_of_lower_triangle, positions_of_lower_triangle]
+
+
+class KnowledgeGraphBagOfWordsSimilarityV3(KnowledgeGraphBagOfWordsSimilarityV1):
+    def __init__(
+        self,
+        shared_artifacts: SharedArtifactStore = None,
+        block_size: int = 512,
+        wordnet_snapshot: str = None,
+        scoring_processes: int = None,
+    ):
+        super().__init__(
+            shared_artifacts,
+            scoring_processes=scoring_processes,
+            wordnet_snapshot=wordnet_snapshot,
+            block_size=block_size,
         )
-        # compute positions for which similarity needs to be computed
-        positions_to_compute_similarity = ~(
-            positions_with_one_entry_empty
-            | positions_with_similar_strings
-            | positions_of_lower_triangle
+
+    def _score_block(
+        self,
+        counts: sparse.csr_matrix,
+        skip_word_counts: sparse.csr_matrix,
+        other_word_counts: npt.NDArray,
+        min_threshold: float,
+        block_start: int,
+    ) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        block = slice(block_start, block_start + self.block_size)
+        weighted_counts = counts[block] @ self.word_similarities
+        totals = (counts @ weighted_counts.T).T
+        pair_counts = (
+            np.outer(other_word_counts[block], other_word_counts)
+            + (skip_word_counts[block] @ skip_word_counts.T).toarray()
         )
-        # get matrix of strings to compute for
-        texts_to_compute = np.where(
-            positions_to_compute_similarity, finding_texts_combinations, ""
+        block_scores = np.divide(
+            totals,
+            pair_counts,
+            out=np.zeros_like(totals),
+            where=pair_counts > 0,
         )
-        # re-shape the matrix into a vector-like form for our function to process
-        texts_to_compute = texts_to_compute.reshape(texts_to_compute.shape[0], -1)
-        similarities = self._compute_text_matrix_similarity(texts_to_compute)
-        # re-shape back to our form. should be a lower triangular matrix containing similarities.
-        similarities = similarities.reshape((num_entries, num_entries))
-        # ensure spatial integrity of returned data
-        assert np.all(
-            (positions_to_compute_similarity[0] | positions_to_compute_similarity[1])
-            == (similarities >= 0)
-        ), "Similarity scores values should correspond to positions where similarities should be computed."
-        # reflect similarity values along the diagonal
-        similarities = np.triu(similarities)
-        similarities = similarities + similarities.T - np.diag(np.diag(similarities))
-        # add known similarities
-        similarities[positions_with_one_entry_empty] = 0.0
-        similarities[positions_with_similar_strings] = 1.0
-        # threshold values and reduce with finding Ids
-        reduced_similarities = np.where(
-            similarities >= threshold, finding_ids_matrix, -1
+        # texts are distinct, hence only similar to themselves. empty texts are not similar to other texts.
+        block_positions = np.arange(block_start, block_start + len(totals))
+        block_scores[np.arange(len(totals)), block_positions] = 1.0
+        block_rows, block_cols = np.nonzero(block_scores >= min_threshold)
+        return (
+            block_rows + block_start,
+            block_cols,
+            block_scores[block_rows, block_cols],
         )
-        results = {}
-        # create final results
-        for idx, finding_id in enumerate(finding_ids):
-            results_temp = reduced_similarities[idx]
-            results[finding_id] = np.delete(results_temp, results_temp == -1).tolist()
-        # update skip words file
-        self._update_skip_words_file()
-        # normalize clusters based on transitive property if required
-        if transitive_clustering:
-            results = self._transitive_clustering(results)
-        return dict(results)
-
 
-class KnowledgeGraphBagOfWordsSimilarityV2(KnowledgeGraphBagOfWordsSimilarityV1):
     # override
-    def apply(
-        self,
-        corpus: Dict[int, str],
-        threshold: float = 0.25,
-        transitive_clustering: bool = True,
-    ) -> Dict[int, Sequence[int]]:
-        results = defaultdict(list)
-        for finding_id_main, finding_text_main in corpus.items():
-            # finding is similar to itself
-            results[finding_id_main].append(finding_id_main)
-            # get all other similar findings
-            for finding_id_sec, finding_text_sec in corpus.items():
-                if finding_text_main != finding_text_sec:
-                    (
-                        saved_similarity_available,
-                        similarity_score,
-                    ) = self._get_saved_similarity(
-                        string_1=finding_text_main,
-                        string_2=finding_text_sec,
-                        saved_collection=self.saved_sentence_similarities,
-                    )
-                    if not saved_similarity_available:
-                        similarity_score = self._compute_sentence_similarity_score(
-                            finding_text_main, finding_text_sec
-                        )
-                        self._save_string_similarity(
-                            string_1=finding_text_main,
-                            string_2=finding_text_sec,
-                            similarity=similarity_score,
-                            saved_collection=self.saved_sentence_similarities,
-                        )
-                else:
-                    similarity_score = 1.0
-                if similarity_score >= threshold:
-                    if finding_id_sec not in results[finding_id_main]:
-                        results[finding_id_main].append(finding_id_sec)
-            results[finding_id_main].sort()
-        # update skip words file
-        self._update_skip_words_file()
-        # normalize clusters based on transitive property if required
-        if transitive_clustering:
-            results = self._transitive_clustering(results)
-        return dict(results)
+    def _compute_pair_scores(
+        self, texts: Sequence[str], min_threshold: float
+    ) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        text_word_ids = self._tokenize_texts(texts)
+        # count words of every text
+        counts = sparse.csr_matrix(
+            (
+                np.ones(sum(len(word_ids) for word_ids in text_word_ids)),
+                np.concatenate([np.zeros(0, dtype=np.int64), *text_word_ids]),
+                np.cumsum([0] + [len(word_ids) for word_ids in text_word_ids]),
+            ),
+            shape=(len(texts), len(self.word_ids)),
+        )
+        skip_word_counts = counts[:, self.is_skip_word]
+        other_word_counts = np.asarray(
+            counts[:, ~self.is_skip_word].sum(axis=1)
+        ).ravel()
+        # total of word similarities of two texts is c1' S c2, normalized by the number of word pairs compared.
+        # word counts are weighted by S one block of texts at a time, so that at most `block_size` x V are held per
+        # process.
+        rows, cols, scores = [], [], []
+        for block_rows, block_cols, block_scores in self._map_scoring(
+            self._score_block,
+            (counts, skip_word_counts, other_word_counts, min_threshold),
+            [(block_start,) for block_start in range(0, len(texts), self.block_size)],
+        ):
+            rows.append(block_rows)
+            cols.append(block_cols)
+            scores.append(block_scores)
+        if len(rows) == 0:
+            return (
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=float),
+            )
+        return (
+            np.concatenate(rows).astype(np.int64),
+            np.concatenate(cols).astype(np.int64),
+            np.concatenate(scores),
+        )
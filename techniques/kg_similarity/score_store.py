@@ -0,0 +1,78 @@
+import tempfile
+from pathlib import Path
+from typing import Sequence
+import numpy as np
+import numpy.typing as npt
+
+
+class TriangularScoreStore:
+    def __init__(self, spill_dir: str = None) -> None:
+        # scores of pairs of texts, stored once per pair in a packed lower triangle indexed by integer text IDs.
+        # rows of new texts are appended, hence stored scores never move.
+        self.spill_dir = spill_dir
+        self.text_ids = {}
+        self.num_texts = 0
+        # missing scores are NaN
+        self.scores = np.zeros(0, dtype=np.float32)
+        # scores are kept in a memory-mapped file of a temporary directory in `spill_dir`, if given
+        self.temp_dir = None
+
+    def __getstate__(self) -> dict:
+        # scores are a cache, copies in other processes start empty instead of sharing the file
+        state = self.__dict__.copy()
+        state["text_ids"] = {}
+        state["num_texts"] = 0
+        state["scores"] = np.zeros(0, dtype=np.float32)
+        state["temp_dir"] = None
+        return state
+
+    @staticmethod
+    def _get_positions(text_ids_1: npt.NDArray, text_ids_2: npt.NDArray) -> npt.NDArray:
+        rows = np.maximum(text_ids_1, text_ids_2)
+        cols = np.minimum(text_ids_1, text_ids_2)
+        return rows * (rows - 1) // 2 + cols
+
+    def _reserve(self, num_texts: int) -> None:
+        if num_texts <= self.num_texts:
+            return
+        previous_size = len(self.scores)
+        size = num_texts * (num_texts - 1) // 2
+        if self.spill_dir is None or size == 0:
+            scores = np.empty(size, dtype=np.float32)
+            scores[:previous_size] = self.scores
+            self.scores = scores
+        else:
+            if self.temp_dir is None:
+                self.temp_dir = tempfile.TemporaryDirectory(
+                    dir=self.spill_dir, prefix="score-store-"
+                )
+            path = Path(self.temp_dir.name) / "scores.f32"
+            # grow the file in place, rows of stored texts stay where they are
+            with open(path, "ab") as f:
+                f.truncate(size * np.dtype(np.float32).itemsize)
+            self.scores = np.memmap(path, dtype=np.float32, mode="r+", shape=(size,))
+        self.scores[previous_size:] = np.nan
+        self.num_texts = num_texts
+
+    def get_text_ids(self, texts: Sequence[str]) -> npt.NDArray:
+        # intern texts, texts seen before keep their ID
+        text_ids = np.array(
+            [self.text_ids.setdefault(text, len(self.text_ids)) for text in texts],
+            dtype=np.int64,
+        )
+        self._reserve(len(self.text_ids))
+        return text_ids
+
+    def get(self, text_ids_1: npt.NDArray, text_ids_2: npt.NDArray) -> npt.NDArray:
+        # scores are NaN if they were not stored yet, texts are most similar to themselves
+        is_different = text_ids_1 != text_ids_2
+        scores = np.ones(len(text_ids_1), dtype=np.float32)
+        scores[is_different] = self.scores[
+            self._get_positions(text_ids_1[is_different], text_ids_2[is_different])
+        ]
+        return scores
+
+    def set(
+        self, text_ids_1: npt.NDArray, text_ids_2: npt.NDArray, scores: npt.NDArray
+    ) -> None:
+        self.scores[self._get_positions(text_ids_1, text_ids_2)] = scores
@@ -0,0 +1,479 @@
+import os
+import math
+import shutil
+import tempfile
+from collections import deque
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+import numpy.typing as npt
+from nltk.corpus import wordnet as wn
+from nltk.corpus.reader.wordnet import POS_LIST, Synset, WordNetCorpusReader
+
+
+def get_preferred_position(synset_names: Sequence[str]) -> int:
+    # retrieve synsets with lowest sense value
+    all_senses = [int(name.split(".")[-1]) for name in synset_names]
+    min_sense = f".{min(all_senses):02d}"
+    positions = [
+        position for position, name in enumerate(synset_names) if min_sense in name
+    ]
+    assert len(positions) > 0, "There should be at least one synset for each word"
+    # return the first synset if just one synset in list
+    if len(positions) == 1:
+        return positions[0]
+    # get preferred part-of-speech synset
+    for pos in ["v", "n", "a"]:
+        for position in positions:
+            if f".{pos}." in synset_names[position]:
+                return position
+    # preferred part-of-speech is not present, hence return the first synset
+    return positions[0]
+
+
+def get_preferred_synset(word: str) -> Optional[Synset]:
+    synsets = wn.synsets(word)
+    if len(synsets) == 0:
+        return None
+    return synsets[get_preferred_position([synset.name() for synset in synsets])]
+
+
+class WordNetTaxonomy:
+    # subsumer of synsets that only share the simulated root of NLTK's Wu-Palmer similarity
+    ROOT = -1
+    # subsumer of synsets without common hypernyms
+    NONE = -2
+
+    def __init__(
+        self,
+        names: npt.NDArray,
+        is_noun: npt.NDArray,
+        min_depths: npt.NDArray,
+        max_depths: npt.NDArray,
+        ancestor_indptr: npt.NDArray,
+        ancestor_ids: npt.NDArray,
+        ancestor_distances: npt.NDArray,
+        words: npt.NDArray,
+        word_synset_ids: npt.NDArray,
+        index_keys: npt.NDArray = None,
+        index_indptr: npt.NDArray = None,
+        index_synset_ids: npt.NDArray = None,
+    ) -> None:
+        # synsets and, in CSR format, their hypernyms (including themselves) at the shortest distance to them
+        self.names = names
+        self.is_noun = is_noun
+        self.min_depths = min_depths
+        self.max_depths = max_depths
+        self.ancestor_indptr = ancestor_indptr
+        self.ancestor_ids = ancestor_ids
+        self.ancestor_distances = ancestor_distances
+        # sorted words and their preferred synset, -1 if they have none
+        self.words = words
+        self.word_synset_ids = word_synset_ids
+        # sorted "<pos> <lemma>" keys and, in CSR format, their synsets. used to resolve inflected words that are
+        # neither lemmas nor exceptions, as `wn.synsets` does.
+        self.index_keys = index_keys
+        self.index_indptr = index_indptr
+        self.index_synset_ids = index_synset_ids
+
+    @classmethod
+    def from_words(
+        cls, words: Sequence[str], index: Sequence[Tuple[str, List[Synset]]] = ()
+    ) -> "WordNetTaxonomy":
+        # resolve preferred synset of every word once and collect all of their hypernyms
+        words = np.unique(np.array(list(words), dtype=str))
+        synset_ids, synsets = {}, []
+
+        def _get_synset_id(_synset: Synset) -> int:
+            if _synset not in synset_ids:
+                synset_ids[_synset] = len(synsets)
+                synsets.append(_synset)
+            return synset_ids[_synset]
+
+        word_synset_ids = []
+        for word in words.tolist():
+            synset = get_preferred_synset(word)
+            word_synset_ids.append(-1 if synset is None else _get_synset_id(synset))
+        index = sorted(index, key=lambda entry: entry[0])
+        index_indptr, index_synset_ids = [0], []
+        for _, index_synsets in index:
+            index_synset_ids.extend(_get_synset_id(synset) for synset in index_synsets)
+            index_indptr.append(len(index_synset_ids))
+        ancestor_indptr, ancestor_ids, ancestor_distances = [0], [], []
+        synset_idx = 0
+        # hypernyms are appended while iterating, so that they get their own ancestors as well
+        while synset_idx < len(synsets):
+            # breadth-first search, as in `Synset._shortest_hypernym_paths`
+            queue, distances = deque([(synsets[synset_idx], 0)]), {}
+            while queue:
+                synset, distance = queue.popleft()
+                if synset in distances:
+                    continue
+                distances[synset] = distance
+                queue.extend(
+                    (hypernym, distance + 1)
+                    for hypernym in synset.hypernyms() + synset.instance_hypernyms()
+                )
+            for synset, distance in distances.items():
+                ancestor_ids.append(_get_synset_id(synset))
+                ancestor_distances.append(distance)
+            ancestor_indptr.append(len(ancestor_ids))
+            synset_idx += 1
+        return cls(
+            names=np.array([synset.name() for synset in synsets], dtype=str),
+            is_noun=np.array([synset.pos() == "n" for synset in synsets], dtype=bool),
+            min_depths=np.array(
+                [synset.min_depth() for synset in synsets], dtype=np.int32
+            ),
+            max_depths=np.array(
+                [synset.max_depth() for synset in synsets], dtype=np.int32
+            ),
+            ancestor_indptr=np.array(ancestor_indptr, dtype=np.int64),
+            ancestor_ids=np.array(ancestor_ids, dtype=np.int32),
+            ancestor_distances=np.array(ancestor_distances, dtype=np.int32),
+            words=words,
+            word_synset_ids=np.array(word_synset_ids, dtype=np.int32),
+            index_keys=np.array([key for key, _ in index], dtype=str),
+            index_indptr=np.array(index_indptr, dtype=np.int64),
+            index_synset_ids=np.array(index_synset_ids, dtype=np.int32),
+        )
+
+    @classmethod
+    def from_wordnet(cls) -> "WordNetTaxonomy":
+        # every lemma and every inflection of the exception lists, and the lemma index of NLTK for other inflections.
+        # note: NLTK does not expose the exception lists and the lemma index, hence their private attributes are read.
+        wn.ensure_loaded()
+        words = set(wn.all_lemma_names())
+        index = []
+        for pos in POS_LIST:
+            words.update(wn._exception_map[pos])
+            for lemma, pos_offsets in wn._lemma_pos_offset_map.items():
+                if pos in pos_offsets:
+                    index.append(
+                        (
+                            f"{pos} {lemma}",
+                            [
+                                wn.synset_from_pos_and_offset(pos, offset)
+                                for offset in pos_offsets[pos]
+                            ],
+                        )
+                    )
+        taxonomy = cls.from_words(words, index)
+        # the snapshot replaces NLTK, hence it should resolve and score words exactly as NLTK does
+        mismatches = taxonomy.get_mismatches(cls.get_sample_words())
+        assert (
+            len(mismatches) == 0
+        ), f"WordNet snapshot differs from NLTK for {mismatches[:10]}."
+        return taxonomy
+
+    def save(self, snapshot_dir: str) -> None:
+        snapshot_dir = Path(snapshot_dir)
+        snapshot_dir.parent.mkdir(parents=True, exist_ok=True)
+        # save into a temporary directory first, so that readers never see a partial snapshot
+        temp_dir = tempfile.mkdtemp(dir=snapshot_dir.parent, prefix=".tmp-")
+        try:
+            # store every array in its own file, so that it can be memory-mapped on load
+            for name, values in vars(self).items():
+                if values is not None:
+                    np.save(Path(temp_dir) / f"{name}.npy", values)
+            os.replace(temp_dir, snapshot_dir)
+        except OSError:
+            # another process saved the snapshot first
+            if not snapshot_dir.is_dir():
+                raise
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, snapshot_dir: str, mmap_mode: str = "r") -> "WordNetTaxonomy":
+        # arrays are memory-mapped, hence shared between processes instead of loaded by each of them
+        return cls(
+            **{
+                file_name.stem: np.load(file_name, mmap_mode=mmap_mode)
+                for file_name in Path(snapshot_dir).glob("*.npy")
+            }
+        )
+
+    @staticmethod
+    def _find(keys: npt.NDArray, values: npt.NDArray) -> npt.NDArray:
+        # positions of values in sorted keys, -1 if they are missing
+        if len(keys) == 0:
+            return np.full(len(values), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(keys, values), len(keys) - 1)
+        return np.where(keys[positions] == values, positions, -1)
+
+    @staticmethod
+    def _apply_substitutions(
+        forms: Sequence[str], substitutions: Sequence[Tuple[str, str]]
+    ) -> List[str]:
+        # distinct results of every substitution that applies to a form, in order of their first occurrence
+        return list(
+            dict.fromkeys(
+                form[: -len(old)] + new
+                for form in forms
+                for old, new in substitutions
+                if form.endswith(old)
+            )
+        )
+
+    def _get_lemma_key_positions(self, pos: str, forms: Sequence[str]) -> List[int]:
+        # positions of the index keys of forms that are lemmas of `pos`, in order of the forms
+        if len(forms) == 0:
+            return []
+        keys = np.array(
+            list(dict.fromkeys(f"{pos} {form}" for form in forms)), dtype=str
+        )
+        return [
+            key_position
+            for key_position in self._find(self.index_keys, keys).tolist()
+            if key_position >= 0
+        ]
+
+    def _get_inflected_synset_id(self, word: str) -> int:
+        word = word.lower()
+        word_position = self._find(self.words, np.array([word], dtype=str))[0]
+        if word_position >= 0:
+            return int(self.word_synset_ids[word_position])
+        # words that are neither lemmas nor exceptions are reduced to lemmas as by `WordNetCorpusReader._morphy` of
+        # NLTK 3.7: rules are applied once, then repeatedly to their results until some of them are lemmas
+        synset_ids = []
+        for pos in POS_LIST:
+            substitutions = WordNetCorpusReader.MORPHOLOGICAL_SUBSTITUTIONS[pos]
+            forms = self._apply_substitutions([word], substitutions)
+            key_positions = self._get_lemma_key_positions(pos, [word] + forms)
+            while len(key_positions) == 0 and len(forms) > 0:
+                forms = self._apply_substitutions(forms, substitutions)
+                key_positions = self._get_lemma_key_positions(pos, forms)
+            for key_position in key_positions:
+                start, end = self.index_indptr[key_position : key_position + 2]
+                synset_ids.extend(self.index_synset_ids[start:end].tolist())
+        if len(synset_ids) == 0:
+            return -1
+        return synset_ids[get_preferred_position(self.names[synset_ids].tolist())]
+
+    def get_synset_ids(self, words: Sequence[str]) -> npt.NDArray:
+        words = np.array(list(words), dtype=str)
+        word_positions = self._find(self.words, words)
+        synset_ids = np.where(
+            word_positions >= 0, self.word_synset_ids[word_positions], -1
+        )
+        if self.index_keys is not None:
+            for position in np.nonzero(word_positions < 0)[0].tolist():
+                synset_ids[position] = self._get_inflected_synset_id(words[position])
+        return synset_ids
+
+    def _get_ancestors(
+        self, synset_ids: npt.NDArray
+    ) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        # expand synsets to rows of (synset position, ancestor, distance)
+        starts = self.ancestor_indptr[synset_ids]
+        counts = self.ancestor_indptr[synset_ids + 1] - starts
+        offsets = np.cumsum(counts) - counts
+        entries = np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+        return (
+            np.repeat(np.arange(len(synset_ids)), counts),
+            self.ancestor_ids[entries],
+            self.ancestor_distances[entries],
+        )
+
+    def _get_path_distances(
+        self, synset_ids: npt.NDArray, subsumer_ids: npt.NDArray
+    ) -> npt.NDArray:
+        # shortest path between synsets and one of their hypernyms, through any hypernym common to both
+        num_synsets = len(self.names)
+        # distances of synsets to their hypernyms, keyed by synset and hypernym
+        unique_synset_ids, synset_positions = np.unique(synset_ids, return_inverse=True)
+        rows, ancestors, distances = self._get_ancestors(unique_synset_ids)
+        keys = rows * num_synsets + ancestors
+        order = np.argsort(keys)
+        keys, distances = keys[order], distances[order]
+        # look up every hypernym of the subsumers in the hypernyms of the synsets
+        (
+            subsumer_positions,
+            subsumer_ancestors,
+            subsumer_distances,
+        ) = self._get_ancestors(subsumer_ids)
+        subsumer_keys = (
+            synset_positions[subsumer_positions] * num_synsets + subsumer_ancestors
+        )
+        found_positions = np.minimum(
+            np.searchsorted(keys, subsumer_keys), len(keys) - 1
+        )
+        path_distances = np.where(
+            keys[found_positions] == subsumer_keys,
+            distances[found_positions] + subsumer_distances,
+            np.iinfo(np.int32).max,
+        )
+        result = np.full(len(subsumer_ids), np.iinfo(np.int32).max, dtype=np.int64)
+        np.minimum.at(result, subsumer_positions, path_distances)
+        return result
+
+    @staticmethod
+    def get_sample_words(num_lemmas: int = 1000) -> List[str]:
+        # evenly spaced lemmas of WordNet and inflections of them, including ones that take several rounds of rules
+        # to be reduced to lemmas
+        lemmas = sorted(wn.all_lemma_names())
+        lemmas = lemmas[:: max(len(lemmas) // num_lemmas, 1)]
+        suffixes = sorted(
+            {
+                old
+                for substitutions in WordNetCorpusReader.MORPHOLOGICAL_SUBSTITUTIONS.values()
+                for old, _ in substitutions
+            }
+        )
+        return lemmas + [
+            lemma + suffix + extra_suffix
+            for lemma in lemmas
+            for suffix in suffixes
+            for extra_suffix in ["", "s"]
+        ]
+
+    def get_mismatches(
+        self, words: Sequence[str], num_similarity_words: int = 50
+    ) -> List[str]:
+        # words whose preferred synset differs from the one of `wn.synsets`, and pairs of words whose Wu-Palmer
+        # similarity differs from `Synset.wup_similarity`
+        words = list(words)
+        synset_ids = self.get_synset_ids(words)
+        synsets = [get_preferred_synset(word) for word in words]
+        mismatches = [
+            word
+            for word, synset_id, synset in zip(words, synset_ids.tolist(), synsets)
+            if (None if synset_id < 0 else str(self.names[synset_id]))
+            != (None if synset is None else synset.name())
+        ]
+        # similarities are compared on evenly spaced words with distinct synsets
+        positions = list(
+            {
+                synset_id: position
+                for position, synset_id in enumerate(synset_ids.tolist())
+                if synset_id >= 0 and synsets[position] is not None
+            }.values()
+        )
+        positions = positions[:: max(len(positions) // num_similarity_words, 1)]
+        similarities = self.get_wup_similarities(synset_ids[positions])
+        for row, position_1 in enumerate(positions):
+            for col, position_2 in enumerate(positions):
+                expected = synsets[position_1].wup_similarity(synsets[position_2])
+                if not math.isclose(
+                    similarities[row, col], expected or 0.0, abs_tol=1e-12
+                ):
+                    mismatches.append(f"{words[position_1]} / {words[position_2]}")
+        return mismatches
+
+    def get_wup_similarities(self, synset_ids: npt.NDArray) -> npt.NDArray:
+        # Wu-Palmer similarity of all pairs of synsets, as computed by `Synset.wup_similarity` of NLTK
+        synset_ids = np.asarray(synset_ids, dtype=np.int64)
+        num_entries = len(synset_ids)
+        rows, ancestors, _ = self._get_ancestors(synset_ids)
+        # lowest common hypernym has the greatest minimum depth, ties are broken by name. hence, pairs are assigned
+        # hypernyms from the least to the most preferred one.
+        preference_order = np.lexsort((self.names, -self.min_depths))[::-1]
+        preference_ranks = np.empty(len(self.names), dtype=np.int64)
+        preference_ranks[preference_order] = np.arange(len(self.names))
+        order = np.argsort(preference_ranks[ancestors], kind="stable")
+        rows, ancestors = rows[order], ancestors[order]
+        split_positions = np.nonzero(np.diff(ancestors))[0] + 1
+        subsumers = np.full((num_entries, num_entries), self.NONE, dtype=np.int64)
+        synset_positions = {
+            synset_id: position
+            for position, synset_id in enumerate(synset_ids.tolist())
+        }
+        # whether synset of the row is a hypernym of the synset of the column
+        is_hypernym = np.zeros((num_entries, num_entries), dtype=bool)
+        for members, ancestor in zip(
+            np.split(rows, split_positions),
+            (
+                ancestors[np.concatenate([[0], split_positions])].tolist()
+                if len(ancestors) > 0
+                else []
+            ),
+        ):
+            subsumers[np.ix_(members, members)] = ancestor
+            if ancestor in synset_positions:
+                is_hypernym[synset_positions[ancestor], members] = True
+        subsumer_min_depths = np.where(
+            subsumers >= 0, self.min_depths[np.maximum(subsumers, 0)], 0
+        )
+        # a root is simulated unless both synsets are nouns, it is preferred over real roots due to its name
+        needs_root = ~(
+            self.is_noun[synset_ids][:, None] & self.is_noun[synset_ids][None, :]
+        )
+        subsumers[needs_root & (subsumer_min_depths == 0)] = self.ROOT
+        # synset is preferred over other lowest common hypernyms if it is one of them
+        is_own_subsumer = (
+            is_hypernym
+            & (subsumers != self.NONE)
+            & (self.min_depths[synset_ids][:, None] == subsumer_min_depths)
+        )
+        subsumers = np.where(is_own_subsumer, synset_ids[:, None], subsumers)
+        # path lengths from both synsets to their subsumer
+        similarities = np.zeros((num_entries, num_entries), dtype=float)
+        pair_rows, pair_cols = np.nonzero(subsumers != self.NONE)
+        pair_subsumers = subsumers[pair_rows, pair_cols]
+        at_root = pair_subsumers == self.ROOT
+        # distance to the simulated root is one more than the one to the farthest hypernym
+        root_distances = (
+            np.maximum.reduceat(self.ancestor_distances, self.ancestor_indptr[:-1]) + 1
+        )
+        path_lengths = []
+        for pair_synsets in (synset_ids[pair_rows], synset_ids[pair_cols]):
+            lengths = np.zeros(len(pair_synsets), dtype=np.int64)
+            lengths[at_root] = root_distances[pair_synsets[at_root]]
+            in_taxonomy = ~at_root & (pair_synsets != pair_subsumers)
+            combinations, combination_positions = np.unique(
+                np.stack(
+                    [pair_synsets[in_taxonomy], pair_subsumers[in_taxonomy]], axis=1
+                ),
+                axis=0,
+                return_inverse=True,
+            )
+            if len(combinations) > 0:
+                lengths[in_taxonomy] = self._get_path_distances(
+                    combinations[:, 0], combinations[:, 1]
+                )[combination_positions.reshape(-1)]
+            path_lengths.append(lengths)
+        depths = (
+            np.where(
+                pair_subsumers == self.ROOT,
+                0,
+                self.max_depths[np.maximum(pair_subsumers, 0)],
+            )
+            + 1
+        )
+        similarities[pair_rows, pair_cols] = (2.0 * depths) / (
+            path_lengths[0] + path_lengths[1] + 2 * depths
+        )
+        return similarities
+
+
+class WordSimilarityTable:
+    def __init__(self, words: Sequence[str], taxonomy: WordNetTaxonomy = None):
+        # similarity of every pair of words, indexed by word ID
+        self.words = list(dict.fromkeys(words))
+        self.word_ids = {word: word_id for word_id, word in enumerate(self.words)}
+        if taxonomy is None:
+            taxonomy = WordNetTaxonomy.from_words(self.words)
+        synset_ids = taxonomy.get_synset_ids(self.words)
+        # similarity is computed once per distinct synset, words without synsets are not similar to other words
+        has_synset = synset_ids >= 0
+        unique_synset_ids, synset_positions = np.unique(
+            synset_ids[has_synset], return_inverse=True
+        )
+        synset_similarities = taxonomy.get_wup_similarities(unique_synset_ids)
+        self.similarities = np.zeros((len(self.words), len(self.words)), dtype=float)
+        word_positions = np.nonzero(has_synset)[0]
+        self.similarities[np.ix_(word_positions, word_positions)] = synset_similarities[
+            np.ix_(synset_positions, synset_positions)
+        ]
+        # similarity of NLTK depends on the order of synsets, e.g. due to the preference of the first one as
+        # subsumer. words are similar by the higher of both orders, regardless of the order they are compared in.
+        self.similarities = np.maximum(self.similarities, self.similarities.T)
+        # maximum similarity if words are same
+        np.fill_diagonal(self.similarities, 1.0)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.word_ids
+
+    def get_similarity(self, word_1: str, word_2: str) -> float:
+        return float(self.similarities[self.word_ids[word_1], self.word_ids[word_2]])
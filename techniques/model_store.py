@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+from gensim.utils import SaveLoad
+
+
+class ModelStore:
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def load(
+        self, fingerprint: str, model_classes: Dict[str, type], mmap: str = "r"
+    ) -> Optional[Dict[str, SaveLoad]]:
+        # models of a fingerprint are only visible once all of them were saved
+        model_dir = self.cache_dir / fingerprint
+        if not model_dir.is_dir():
+            return None
+        # large arrays are memory-mapped instead of read into memory. optional models that were not saved are left
+        # out.
+        return {
+            name: model_class.load(str(model_dir / name), mmap=mmap)
+            for name, model_class in model_classes.items()
+            if (model_dir / name).exists()
+        }
+
+    def save(self, fingerprint: str, models: Dict[str, SaveLoad]) -> None:
+        model_dir = self.cache_dir / fingerprint
+        if model_dir.is_dir():
+            return
+        # save into a temporary directory first, so that readers never see partially saved models
+        temp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            for name, model in models.items():
+                # store every array in its own file, so that it can be memory-mapped on load
+                model.save(str(Path(temp_dir) / name), sep_limit=0)
+            os.replace(temp_dir, model_dir)
+        except OSError:
+            # another process saved the same models first
+            if not model_dir.is_dir():
+                raise
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
@@ -1,8 +1,16 @@
-from copy import deepcopy
-from typing import Dict, Sequence
-from collections import defaultdict
-from sentence_transformers import SentenceTransformer, util
-from techniques.base import BaseTechnique
+import hashlib
+import weakref
+import multiprocessing as mp
+from typing import Any, Dict, List, Sequence, Tuple
+import numpy as np
+import numpy.typing as npt
+import torch
+from sentence_transformers import SentenceTransformer
+from techniques import similarity_search
+from techniques.ann_index import IvfFlatIndex
+from techniques.base import BaseTechnique, SimilarityScores
+from techniques.embedding_cache import EmbeddingCache
+from techniques.shared_artifacts import SharedArtifactStore
 
 
 class SbertSemanticSearch(BaseTechnique):
@@ -12,67 +20,349 @@ class SbertSemanticSearch(BaseTechnique):
         "multi-qa-MiniLM-L6-cos-v1",
         "multi-qa-mpnet-base-dot-v1",
     ]
+    SEARCH_MODES = ["exact", "ann"]
+    INFERENCE_MODES = ["float", "int8"]
 
-    def __init__(self, embedder: str) -> None:
-        self.embedder = SentenceTransformer(embedder)
+    def __init__(
+        self,
+        embedder: str,
+        cache_dir: str = None,
+        cache_max_entries: int = 500000,
+        cache_eviction_policy: str = "lru",
+        block_size: int = 512,
+        ann_params: dict = None,
+        precision: str = "float32",
+        rescore_margin: float = 0.02,
+        inference_mode: str = "float",
+        encode_processes: int = None,
+        shared_artifacts: SharedArtifactStore = None,
+    ) -> None:
+        self.embedder_name = embedder
+        # number of query rows scored at once during similarity search
+        self.block_size = block_size
+        # parameters of approximate nearest-neighbour index, e.g. `num_lists` and `num_probes`
+        self.ann_params = ann_params or {}
+        self.ann_index = None
+        self.ann_index_fingerprint = None
+        self.ann_comparison = None
+        # storage precision of corpus embeddings during exact search. pairs passing the threshold within
+        # `rescore_margin` are re-scored at full precision, hence kept scores are exact.
+        assert (
+            precision in similarity_search.CompactEmbeddings.PRECISIONS
+        ), f"Precision should be one of {similarity_search.CompactEmbeddings.PRECISIONS}."
+        self.precision = precision
+        self.rescore_margin = rescore_margin
+        self.compact_embeddings = None
+        self.compact_embeddings_fingerprint = None
+        self.inference_mode = inference_mode
+        self.embedder = self._load_embedder(embedder, inference_mode)
+        # number of CPU processes to encode with, the pool is started on first use and kept warm across calls.
+        # it is stopped by `close`, or once the technique is garbage collected or the interpreter exits.
+        self.encode_processes = encode_processes
+        self.encode_pool = None
+        self.encode_pool_finalizer = None
+        # share corpus embeddings with other processes working on the same corpus
+        self.shared_artifacts = shared_artifacts
+        # persist embeddings on disk to avoid re-encoding texts seen in earlier runs
+        self.embedding_cache = None
+        if cache_dir:
+            self.embedding_cache = EmbeddingCache(
+                cache_dir=cache_dir,
+                # embeddings of quantized models differ slightly, so they are cached separately
+                model_name=(
+                    embedder
+                    if inference_mode == "float"
+                    else f"{embedder}-{inference_mode}"
+                ),
+                max_entries=cache_max_entries,
+                eviction_policy=cache_eviction_policy,
+            )
+
+    @classmethod
+    def _load_embedder(cls, embedder: str, inference_mode: str) -> SentenceTransformer:
+        if inference_mode == "onnx":
+            # the ONNX backend was added in sentence-transformers 3.2, the pinned version has no `backend` argument
+            raise ValueError(
+                "ONNX inference requires sentence-transformers>=3.2, "
+                f"use one of {cls.INFERENCE_MODES}."
+            )
+        assert (
+            inference_mode in cls.INFERENCE_MODES
+        ), f"Inference mode should be one of {cls.INFERENCE_MODES}."
+        if inference_mode == "int8":
+            # dynamically quantize weights of linear layers to int8 for CPU inference
+            return torch.quantization.quantize_dynamic(
+                SentenceTransformer(embedder, device="cpu"),
+                {torch.nn.Linear},
+                dtype=torch.qint8,
+            )
+        return SentenceTransformer(embedder)
+
+    def __getstate__(self) -> dict:
+        # pool of encoder processes cannot be transferred to other processes
+        state = self.__dict__.copy()
+        state["encode_pool"] = None
+        state["encode_pool_finalizer"] = None
+        return state
+
+    def __enter__(self) -> "SbertSemanticSearch":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.encode_pool_finalizer is not None:
+            # stops the pool, at most once
+            self.encode_pool_finalizer()
+        self.encode_pool = None
+        self.encode_pool_finalizer = None
+
+    def _get_encode_pool(self) -> Dict[str, Any]:
+        if mp.current_process().daemon:
+            # daemonic processes, e.g. `mp.Pool` workers, are not allowed to have child processes
+            raise ValueError(
+                "Encoding with multiple processes is not possible in a daemonic process, "
+                "set encode_processes to 1 or run the technique in a non-daemonic process."
+            )
+        if self.encode_pool is None:
+            self.encode_pool = self.embedder.start_multi_process_pool(
+                target_devices=["cpu"] * self.encode_processes
+            )
+            self.encode_pool_finalizer = weakref.finalize(
+                self, SentenceTransformer.stop_multi_process_pool, self.encode_pool
+            )
+        return self.encode_pool
+
+    def _encode_strings(self, strings: Sequence[str]) -> npt.NDArray:
+        if not self.encode_processes or self.encode_processes < 2:
+            return self.embedder.encode(strings, convert_to_numpy=True)
+        # chunks are encoded by every process in parallel and returned in original order
+        return self.embedder.encode_multi_process(
+            list(strings), self._get_encode_pool()
+        )
+
+    def _encode(self, corpus_strings: Sequence[str]) -> npt.NDArray:
+        # embeddings are normalized before they are shared, so that searches use them without private copies
+        if self.shared_artifacts is None:
+            return similarity_search.normalize_embeddings(
+                self._encode_corpus(corpus_strings)
+            )
+        artifact_key = "embeddings:" + self.shared_artifacts.get_fingerprint(
+            self.embedder_name, self.inference_mode, *corpus_strings
+        )
+        return self.shared_artifacts.get_or_publish(
+            artifact_key,
+            lambda: similarity_search.normalize_embeddings(
+                self._encode_corpus(corpus_strings)
+            ),
+        )
+
+    def _encode_corpus(self, corpus_strings: Sequence[str]) -> npt.NDArray:
+        if self.embedding_cache is None:
+            return self._encode_strings(corpus_strings)
+        keys = [self.embedding_cache.get_key(string) for string in corpus_strings]
+        embeddings = self.embedding_cache.get_many(keys)
+        # encode every text not present in cache exactly once
+        missing_strings = {}
+        for key, string in zip(keys, corpus_strings):
+            if key not in embeddings and key not in missing_strings:
+                missing_strings[key] = string
+        if missing_strings:
+            # cached embeddings are stored at lower precision, new ones are rounded alike so that results do not
+            # depend on the cache contents
+            missing_embeddings = self._encode_strings(
+                list(missing_strings.values())
+            ).astype(EmbeddingCache.DTYPE)
+            self.embedding_cache.put_many(
+                list(missing_strings.keys()), missing_embeddings
+            )
+            embeddings.update(zip(missing_strings.keys(), missing_embeddings))
+        self.embedding_cache.save()
+        return np.stack([embeddings[key] for key in keys]).astype(np.float32)
+
+    def _get_ann_index(self, corpus_embeddings: npt.NDArray) -> IvfFlatIndex:
+        # build index once per corpus and reuse it for every threshold
+        fingerprint = hashlib.sha1(corpus_embeddings.tobytes()).hexdigest()
+        if self.ann_index is None or self.ann_index_fingerprint != fingerprint:
+            self.ann_index = IvfFlatIndex(**self.ann_params).fit(corpus_embeddings)
+            self.ann_index_fingerprint = fingerprint
+        return self.ann_index
+
+    def _get_compact_embeddings(
+        self, corpus_strings: Sequence[str], corpus_embeddings: npt.NDArray = None
+    ) -> similarity_search.CompactEmbeddings:
+        # quantize once per corpus and reuse for every threshold
+        fingerprint = SharedArtifactStore.get_fingerprint(
+            self.embedder_name, self.inference_mode, *corpus_strings
+        )
+        if (
+            self.compact_embeddings is None
+            or self.compact_embeddings_fingerprint != fingerprint
+        ):
+            # quantize straight from the encoder output, full precision embeddings are only kept on disk
+            self.compact_embeddings = None
+            if corpus_embeddings is None:
+                corpus_embeddings = self._encode(corpus_strings)
+            self.compact_embeddings = similarity_search.CompactEmbeddings(
+                corpus_embeddings, precision=self.precision
+            )
+            self.compact_embeddings_fingerprint = fingerprint
+        return self.compact_embeddings
+
+    def _search(
+        self, corpus_embeddings: npt.NDArray, threshold: float, search_mode: str
+    ) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+        assert (
+            search_mode in self.SEARCH_MODES
+        ), f"Search mode should be one of {self.SEARCH_MODES}."
+        if search_mode == "ann":
+            return self._get_ann_index(corpus_embeddings).threshold_search(threshold)
+        elif self.precision != "float32":
+            return similarity_search.compact_threshold_search(
+                self.compact_embeddings,
+                threshold=threshold,
+                block_size=self.block_size,
+                rescore_margin=self.rescore_margin,
+            )
+        return similarity_search.threshold_search(
+            corpus_embeddings,
+            threshold=threshold,
+            block_size=self.block_size,
+            normalized=True,
+        )
+
+    def score(
+        self,
+        corpus: Dict[int, str],
+        min_threshold: float = 0.0,
+        search_mode: str = "exact",
+        compare_exact: bool = False,
+    ) -> SimilarityScores:
+        finding_ids, unique_texts, text_positions = self._get_unique_texts(corpus)
+        # exact search at lower precision only needs the quantized embeddings
+        corpus_embeddings = None
+        if search_mode == "ann" or self.precision == "float32":
+            corpus_embeddings = self._encode(unique_texts)
+        if self.precision != "float32" and (search_mode == "exact" or compare_exact):
+            self._get_compact_embeddings(unique_texts, corpus_embeddings)
+        # get sparse list of text positions whose similarity passes our threshold
+        scores = SimilarityScores(
+            finding_ids,
+            *self._search(corpus_embeddings, min_threshold, search_mode),
+            min_threshold=min_threshold,
+            text_positions=text_positions,
+        )
+        # keep exact search scores to report the accuracy cost of approximate search
+        if search_mode == "ann" and compare_exact:
+            scores.reference = SimilarityScores(
+                finding_ids,
+                *self._search(corpus_embeddings, min_threshold, "exact"),
+                min_threshold=min_threshold,
+                text_positions=text_positions,
+            )
+        return scores
+
+    @staticmethod
+    def _get_pair_recall(scores: SimilarityScores, threshold: float) -> float:
+        # share of exact neighbour pairs that were also found by approximate search
+        num_entries = scores.num_texts
+        passed = scores.scores >= threshold
+        exact_passed = scores.reference.scores >= threshold
+        pairs = scores.rows[passed] * num_entries + scores.cols[passed]
+        exact_pairs = (
+            scores.reference.rows[exact_passed] * num_entries
+            + scores.reference.cols[exact_passed]
+        )
+        return float(
+            np.isin(exact_pairs, pairs).mean() if len(exact_pairs) > 0 else 1.0
+        )
+
+    @staticmethod
+    def _compare_evaluations(
+        evaluation: dict, exact_evaluation: dict, pair_recall: float, round_digits: int
+    ) -> dict:
+        return {
+            "pair_recall": round(pair_recall, round_digits),
+            "exact_accuracy": exact_evaluation["accuracy"]["average"],
+            "exact_f-measure": exact_evaluation["f-measure"],
+            "f-measure_loss": exact_evaluation["f-measure"] - evaluation["f-measure"],
+        }
+
+    def cluster(
+        self,
+        scores: SimilarityScores,
+        threshold: float,
+        transitive_clustering: bool = True,
+    ) -> Dict[int, Sequence[int]]:
+        results = super().cluster(scores, threshold, transitive_clustering)
+        self.ann_comparison = None
+        if scores.reference is not None:
+            exact_results = super().cluster(
+                scores.reference, threshold, transitive_clustering
+            )
+            self.ann_comparison = {
+                "predictions": results,
+                "exact_predictions": exact_results,
+                "pair_recall": self._get_pair_recall(scores, threshold),
+            }
+        return results
 
     def apply(
         self,
         corpus: Dict[int, str],
         threshold: float = 0.2,
         transitive_clustering: bool = True,
+        search_mode: str = "exact",
+        compare_exact: bool = False,
     ) -> Dict[int, Sequence[int]]:
-        # ensure we have a threshold variable
-        corpus_strings = list(corpus.values())
-        corpus_embeddings = self.embedder.encode(corpus_strings, convert_to_tensor=True)
-        # get query results from technique
-        query_results = util.semantic_search(
-            corpus_embeddings, corpus_embeddings, top_k=len(corpus_strings)
+        scores = self.score(
+            corpus,
+            min_threshold=threshold,
+            search_mode=search_mode,
+            compare_exact=compare_exact,
+        )
+        return self.cluster(scores, threshold, transitive_clustering)
+
+    def evaluate(
+        self,
+        labels: Dict[Any, Sequence[int]],
+        predictions: Dict[int, Sequence[int]],
+        round_digits: int = 3,
+    ) -> dict:
+        evaluation = super().evaluate(labels, predictions, round_digits)
+        # add comparison against exact search if predictions came from approximate search
+        if self.ann_comparison and self.ann_comparison["predictions"] is predictions:
+            exact_evaluation = super().evaluate(
+                labels, self.ann_comparison["exact_predictions"], round_digits
+            )
+            evaluation["ann"] = self._compare_evaluations(
+                evaluation,
+                exact_evaluation,
+                self.ann_comparison["pair_recall"],
+                round_digits,
+            )
+        return evaluation
+
+    def evaluate_thresholds(
+        self,
+        labels: Dict[Any, Sequence[int]],
+        scores: SimilarityScores,
+        thresholds: Sequence[float],
+        round_digits: int = 3,
+    ) -> List[dict]:
+        results = super().evaluate_thresholds(labels, scores, thresholds, round_digits)
+        if scores.reference is None:
+            return results
+        # compare every cut of approximate search against the same cut of exact search scores
+        exact_results = super().evaluate_thresholds(
+            labels, scores.reference, thresholds, round_digits
         )
-        # create string -> Id mapping
-        string_id_mapping = defaultdict(list)
-        for _id, corpus_string in corpus.items():
-            string_id_mapping[corpus_string].append(_id)
-        # sort result into corpus id -> sequence of related findings that pass our threshold
-        results = defaultdict(list)
-
-        # function to get string id for a search result
-        def get_string_id_from_search_result(
-            _string_id_mapping: defaultdict, _search_result: dict
-        ) -> int:
-            # get string of the result
-            _corpus_string = corpus_strings[_search_result["corpus_id"]]
-            # get corresponding id from the original corpus
-            return _string_id_mapping[_corpus_string].pop()
-
-        # create a copy of string id mapping for the search strings (we don't want the same string Id's to repeat for
-        # same string)
-        string_id_mapping_search_string = deepcopy(string_id_mapping)
-        for query_result in query_results:
-            # create a copy of string id mapping, since it will get modified for every query result
-            string_id_mapping_other_results = deepcopy(string_id_mapping)
-            # query results are based on descending similarity score, so first result would be the search term itself
-            search_string_id = get_string_id_from_search_result(
-                string_id_mapping_search_string, query_result[0]
+        for result, exact_result in zip(results, exact_results):
+            result["evaluation"]["ann"] = self._compare_evaluations(
+                result["evaluation"],
+                exact_result["evaluation"],
+                self._get_pair_recall(scores, result["threshold"]),
+                round_digits,
             )
-            results[search_string_id] = []  # initiate with empty list
-            # iterate over other results and see if
-            for other_result in query_result:
-                # only include the result if it crosses threshold (if applicable)
-                if float(other_result["score"]) < threshold:
-                    continue
-                # get corresponding id from the original corpus
-                corpus_string_id = get_string_id_from_search_result(
-                    string_id_mapping_other_results, other_result
-                )
-                # add id to results if it doesn't already exist
-                if corpus_string_id not in results[search_string_id]:
-                    # save result in hits for query string
-                    results[search_string_id].append(corpus_string_id)
-            # sort the list for easier processing in future
-            results[search_string_id].sort()
-
-        # normalize clusters based on transitive property if required
-        if transitive_clustering:
-            results = self._transitive_clustering(results)
-        return dict(results)
+        return results
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Iterator, Optional
+import numpy as np
+import numpy.typing as npt
+
+
+class SharedArtifactStore:
+    HEADER_SIZE = 256
+
+    def __init__(self, namespace: str = None) -> None:
+        # segments of all processes sharing this store are prefixed by its namespace
+        self.namespace = namespace or f"sefidef_{os.getpid()}"
+        self.segments = {}
+        # lock files and the names of created segments are kept in a directory of the namespace
+        self.state_dir = Path(tempfile.gettempdir()) / self.namespace
+        # start resource tracker before workers are forked, so that all of them share it and segments outlive the
+        # worker that created them
+        resource_tracker.ensure_running()
+
+    def __getstate__(self) -> dict:
+        # opened segments are process-local and re-attached by name
+        state = self.__dict__.copy()
+        state["segments"] = {}
+        return state
+
+    def _get_segment_name(self, key: str) -> str:
+        return f"{self.namespace}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]}"
+
+    def _read_array(self, segment: shared_memory.SharedMemory) -> Optional[npt.NDArray]:
+        # first byte flags whether the publisher has finished writing
+        if segment.buf[0] != 1:
+            return None
+        header = bytes(segment.buf[1 : self.HEADER_SIZE]).rstrip(b"\0")
+        metadata = json.loads(header.decode("utf-8"))
+        array = np.ndarray(
+            tuple(metadata["shape"]),
+            dtype=np.dtype(metadata["dtype"]),
+            buffer=segment.buf,
+            offset=self.HEADER_SIZE,
+        )
+        array.flags.writeable = False
+        return array
+
+    def get(self, key: str, timeout: float = 60.0) -> Optional[npt.NDArray]:
+        segment_name = self._get_segment_name(key)
+        segment = self.segments.get(segment_name)
+        if segment is None:
+            try:
+                segment = shared_memory.SharedMemory(name=segment_name)
+            except FileNotFoundError:
+                return None
+            self.segments[segment_name] = segment
+        # wait for the publisher to finish writing, up to `timeout` seconds
+        deadline = time.monotonic() + timeout
+        array = self._read_array(segment)
+        while array is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+            array = self._read_array(segment)
+        return array
+
+    @contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        # serialize processes working on the same key, e.g. to compute an artifact only once
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        lock_path = self.state_dir / f"{self._get_segment_name(key)}.lock"
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_or_publish(
+        self, key: str, compute_array: Callable[[], npt.NDArray]
+    ) -> npt.NDArray:
+        # the first process computes and publishes the artifact, others wait for it and attach
+        with self.lock(key):
+            array = self.get(key, timeout=0.0)
+            if array is None:
+                array = self.publish(key, compute_array())
+        return array
+
+    def _register_segment(self, segment_name: str) -> None:
+        # record created segments, so that `unlink_all` removes exactly those
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.state_dir / "segments", "a") as f:
+            f.write(segment_name + "\n")
+
+    def publish(self, key: str, array: npt.NDArray) -> npt.NDArray:
+        array = np.ascontiguousarray(array)
+        segment_name = self._get_segment_name(key)
+        try:
+            segment = shared_memory.SharedMemory(
+                name=segment_name,
+                create=True,
+                size=self.HEADER_SIZE + max(array.nbytes, 1),
+            )
+        except FileExistsError:
+            # another process published the same artifact first, use it once it is written
+            shared_array = self.get(key)
+            return array if shared_array is None else shared_array
+        self._register_segment(segment_name)
+        self.segments[segment_name] = segment
+        header = json.dumps(
+            {"dtype": array.dtype.str, "shape": list(array.shape)}
+        ).encode("utf-8")
+        assert len(header) < self.HEADER_SIZE, "Artifact metadata exceeds header size."
+        segment.buf[1 : 1 + len(header)] = header
+        shared_array = np.ndarray(
+            array.shape, dtype=array.dtype, buffer=segment.buf, offset=self.HEADER_SIZE
+        )
+        shared_array[...] = array
+        # mark artifact as ready for other processes
+        segment.buf[0] = 1
+        shared_array.flags.writeable = False
+        return shared_array
+
+    @staticmethod
+    def get_fingerprint(*parts: str) -> str:
+        fingerprint = hashlib.sha1()
+        for part in parts:
+            fingerprint.update(part.encode("utf-8"))
+            fingerprint.update(b"\0")
+        return fingerprint.hexdigest()
+
+    def close(self) -> None:
+        for segment in self.segments.values():
+            try:
+                segment.close()
+            except BufferError:
+                # arrays of this process still reference the segment, it is released with them
+                pass
+        self.segments = {}
+
+    def unlink_all(self) -> None:
+        # remove every segment created under this namespace, by any process
+        self.close()
+        registry_path = self.state_dir / "segments"
+        if registry_path.exists():
+            for segment_name in set(registry_path.read_text().split()):
+                try:
+                    segment = shared_memory.SharedMemory(name=segment_name)
+                except FileNotFoundError:
+                    continue
+                segment.close()
+                segment.unlink()
+        shutil.rmtree(self.state_dir, ignore_errors=True)
@@ -0,0 +1,299 @@
+import json
+import uuid
+import tempfile
+from pathlib import Path
+from typing import Iterator, Tuple
+import numpy as np
+import numpy.typing as npt
+
+
+def normalize_embeddings(embeddings: npt.NDArray) -> npt.NDArray:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    # leave zero vectors as they are, their similarity to everything is zero
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def threshold_search(
+    embeddings: npt.NDArray,
+    threshold: float,
+    block_size: int = 512,
+    query_embeddings: npt.NDArray = None,
+    normalized: bool = False,
+) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+    # compute cosine similarities tile by tile, so that at most `block_size` x N scores are held in memory.
+    # embeddings that are `normalized` already, e.g. shared with other processes, are used without a copy.
+    corpus_embeddings = (
+        np.asarray(embeddings, dtype=np.float32)
+        if normalized
+        else normalize_embeddings(embeddings)
+    )
+    if query_embeddings is None:
+        query_embeddings = corpus_embeddings
+    else:
+        query_embeddings = normalize_embeddings(query_embeddings)
+    rows, cols, scores = [], [], []
+    for block_start in range(0, len(query_embeddings), block_size):
+        block_scores = (
+            query_embeddings[block_start : block_start + block_size]
+            @ corpus_embeddings.T
+        )
+        # keep only pairs that pass the threshold
+        block_rows, block_cols = np.nonzero(block_scores >= threshold)
+        rows.append(block_rows + block_start)
+        cols.append(block_cols)
+        scores.append(block_scores[block_rows, block_cols])
+    if len(rows) == 0:
+        return (
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.float32),
+        )
+    # result is a sparse neighbour list in coordinate format, sorted by query and corpus positions
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+
+
+def neighbour_lists(
+    rows: npt.NDArray, cols: npt.NDArray, num_entries: int
+) -> Tuple[npt.NDArray, ...]:
+    # group corpus positions of a coordinate-format neighbour list by query position
+    order = np.lexsort((cols, rows))
+    split_positions = np.cumsum(np.bincount(rows, minlength=num_entries))[:-1]
+    return tuple(np.split(cols[order], split_positions))
+
+
+class CompactEmbeddings:
+    PRECISIONS = ["float32", "float16", "int8"]
+
+    def __init__(
+        self,
+        embeddings: npt.NDArray,
+        precision: str = "float16",
+        spill_dir: str = None,
+        block_size: int = 4096,
+    ) -> None:
+        assert (
+            precision in self.PRECISIONS
+        ), f"Precision should be one of {self.PRECISIONS}."
+        self.precision = precision
+        self.shape = np.shape(embeddings)
+        self.values = np.empty(self.shape, dtype=np.dtype(precision))
+        self.scales = None
+        if precision == "int8":
+            self.scales = np.empty(self.shape[0], dtype=np.float32)
+        # full precision embeddings are only needed for rescoring, so keep them on disk
+        self.full_precision = None
+        if precision != "float32":
+            self.full_precision = np.memmap(
+                tempfile.TemporaryFile(dir=spill_dir),
+                dtype=np.float32,
+                mode="w+",
+                shape=self.shape,
+            )
+        # quantize block by block, so that no normalized copy of all embeddings is held in memory
+        for start in range(0, self.shape[0], block_size):
+            block = slice(start, start + block_size)
+            normalized = normalize_embeddings(embeddings[block])
+            if self.full_precision is not None:
+                self.full_precision[block] = normalized
+            if precision == "int8":
+                # symmetric scalar quantization with one scale per embedding
+                scales = np.abs(normalized).max(axis=1) / 127.0
+                scales[scales == 0] = 1.0
+                self.values[block] = np.round(normalized / scales[:, None])
+                self.scales[block] = scales
+            else:
+                self.values[block] = normalized
+        if self.full_precision is not None:
+            self.full_precision.flush()
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    def decode(self, start: int, stop: int) -> npt.NDArray:
+        block = self.values[start:stop].astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:stop, None]
+        return block
+
+    def rescore(
+        self, rows: npt.NDArray, cols: npt.NDArray, chunk_size: int = 65536
+    ) -> npt.NDArray:
+        full_precision = (
+            self.values if self.full_precision is None else self.full_precision
+        )
+        # pairs are rescored in chunks, so that at most `chunk_size` pairs of embeddings are gathered at once
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            scores[chunk] = np.einsum(
+                "ij,ij->i", full_precision[rows[chunk]], full_precision[cols[chunk]]
+            )
+        return scores
+
+
+def compact_threshold_search(
+    embeddings: CompactEmbeddings,
+    threshold: float,
+    block_size: int = 512,
+    rescore_margin: float = 0.02,
+) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+    # NumPy has no fast float16/int8 matrix products, so tiles are widened to float32 one at a time
+    column_block_size = block_size * 8
+    rows, cols, scores = [], [], []
+    for row_start in range(0, len(embeddings), block_size):
+        row_block = embeddings.decode(row_start, row_start + block_size)
+        for col_start in range(0, len(embeddings), column_block_size):
+            col_block = embeddings.decode(col_start, col_start + column_block_size)
+            block_scores = row_block @ col_block.T
+            # keep candidates that can pass the threshold within the approximation margin
+            block_rows, block_cols = np.nonzero(
+                block_scores >= threshold - rescore_margin
+            )
+            block_rows, block_cols = block_rows + row_start, block_cols + col_start
+            # rescore candidates at full precision, so that kept scores are exact for every higher threshold too
+            block_candidate_scores = embeddings.rescore(block_rows, block_cols)
+            passed = block_candidate_scores >= threshold
+            rows.append(block_rows[passed])
+            cols.append(block_cols[passed])
+            scores.append(block_candidate_scores[passed])
+    if len(rows) == 0:
+        return (
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.float32),
+        )
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+
+
+class ShardedIndex:
+    def __init__(
+        self, num_features: int, shard_size: int = 100000, spill_dir: str = None
+    ) -> None:
+        # normalized embeddings stored as row blocks in memory-mapped files, so that the corpus size is bounded by
+        # disk rather than memory
+        self.num_features = num_features
+        self.shard_size = shard_size
+        self.spill_dir = spill_dir
+        self.shard_paths = []
+        self.shards = []
+        # shards written by this index are removed together with it
+        self.temp_dir = None
+
+    def __getstate__(self) -> dict:
+        # shards are re-opened from their files, which stay owned by the original index
+        state = self.__dict__.copy()
+        state["shards"] = []
+        state["temp_dir"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.shards = [np.load(path, mmap_mode="r") for path in self.shard_paths]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+    def _write_shard(self, embeddings: npt.NDArray) -> Tuple[str, npt.NDArray]:
+        if self.temp_dir is None:
+            self.temp_dir = tempfile.TemporaryDirectory(
+                dir=self.spill_dir, prefix="sharded-index-"
+            )
+        path = str(Path(self.temp_dir.name) / f"shard-{uuid.uuid4().hex}.npy")
+        np.save(path, np.ascontiguousarray(embeddings, dtype=np.float32))
+        return path, np.load(path, mmap_mode="r")
+
+    def _replace_shard(self, shard_idx: int, embeddings: npt.NDArray) -> None:
+        previous_path = self.shard_paths[shard_idx]
+        self.shard_paths[shard_idx], self.shards[shard_idx] = self._write_shard(
+            embeddings
+        )
+        # remove previous shard, unless it belongs to a saved index
+        if Path(previous_path).parent == Path(self.temp_dir.name):
+            Path(previous_path).unlink()
+
+    def append(self, embeddings: npt.NDArray) -> None:
+        embeddings = normalize_embeddings(embeddings)
+        # fill up last shard first
+        if self.shards and len(self.shards[-1]) < self.shard_size:
+            num_free_rows = self.shard_size - len(self.shards[-1])
+            self._replace_shard(
+                len(self.shards) - 1,
+                np.concatenate([self.shards[-1], embeddings[:num_free_rows]]),
+            )
+            embeddings = embeddings[num_free_rows:]
+        for shard_start in range(0, len(embeddings), self.shard_size):
+            path, shard = self._write_shard(
+                embeddings[shard_start : shard_start + self.shard_size]
+            )
+            self.shard_paths.append(path)
+            self.shards.append(shard)
+
+    def transform(self, projection: npt.NDArray) -> None:
+        # map every embedding to a new space, one shard at a time
+        for shard_idx, shard in enumerate(self.shards):
+            self._replace_shard(shard_idx, normalize_embeddings(shard @ projection))
+        self.num_features = projection.shape[1]
+
+    def iter_shards(self) -> Iterator[Tuple[int, npt.NDArray]]:
+        shard_start = 0
+        for shard in self.shards:
+            yield shard_start, shard
+            shard_start += len(shard)
+
+    def save(self, fname: str, **kwargs) -> None:
+        # shards are stored next to a metadata file, so that they can be memory-mapped on load
+        shard_names = []
+        for shard_idx, shard in enumerate(self.shards):
+            shard_names.append(f"{Path(fname).name}.shard-{shard_idx}.npy")
+            np.save(Path(fname).parent / shard_names[-1], shard)
+        with open(fname, "w") as f:
+            json.dump(
+                {
+                    "num_features": self.num_features,
+                    "shard_size": self.shard_size,
+                    "shards": shard_names,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, fname: str, mmap: str = "r") -> "ShardedIndex":
+        with open(fname, "r") as f:
+            metadata = json.load(f)
+        index = cls(metadata["num_features"], shard_size=metadata["shard_size"])
+        index.shard_paths = [
+            str(Path(fname).parent / shard_name) for shard_name in metadata["shards"]
+        ]
+        index.shards = [np.load(path, mmap_mode=mmap) for path in index.shard_paths]
+        return index
+
+
+def sharded_threshold_search(
+    index: ShardedIndex,
+    query_embeddings: npt.NDArray,
+    threshold: float,
+    block_size: int = 512,
+) -> Tuple[npt.NDArray, npt.NDArray, npt.NDArray]:
+    # stream over shards, so that only one shard and a block of scores are held in memory at a time
+    query_embeddings = normalize_embeddings(query_embeddings)
+    rows, cols, scores = [], [], []
+    for shard_start, shard in index.iter_shards():
+        shard_rows, shard_cols, shard_scores = threshold_search(
+            shard, threshold, block_size=block_size, query_embeddings=query_embeddings
+        )
+        rows.append(shard_rows)
+        cols.append(shard_cols + shard_start)
+        scores.append(shard_scores)
+    if len(rows) == 0:
+        return (
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.float32),
+        )
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)